@@ -16,14 +16,22 @@ helpers (prefixed with an underscore) are intended for internal use only.
 
 """
 import json
-from typing import List, Tuple, Optional, Union, Literal
-
-from pyparsing import originalTextFor, lineStart, nestedExpr
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from hashlib import sha256
+from typing import List, Tuple, Optional, Union, Literal, Callable, Any
 
 from mj_rag.interfaces import (VectorDBServiceInterface, SqlDBServiceInterface,
                                LoggingServiceInterface, LLMServiceInterface,
                                EmbeddingServiceInterface)
+from mj_rag.cache import EmbeddingsCache, CachedEmbeddingService, LRUCache, SqliteCache
+import inspect
+import io
+import os
 import re
+import threading
+import time
 from pprint import pformat
 import logging
 from pathlib import Path
@@ -31,6 +39,11 @@ from enum import Enum
 import tiktoken
 import numpy as np
 
+try:
+    import orjson
+except ImportError:  # optional speed-up, see the ``speedups`` extra
+    orjson = None
+
 
 class SectionAnswerMode(Enum):
     """Enumeration of high‑level answer‑generation strategies.
@@ -69,15 +82,92 @@ class SectionAnswerMode(Enum):
 class NumpyEncoder(json.JSONEncoder):
     """ Special json encoder for numpy types """
     def default(self, obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
+        # numpy scalars (integers, floats, bools) all convert through ``item``
+        if isinstance(obj, np.generic):
+            return obj.item()
         elif isinstance(obj, np.ndarray):
             return obj.tolist()
         return json.JSONEncoder.default(self, obj)
 
 
+def _json_dumps(obj, indent: bool = False) -> str:
+    """Serialise *obj* (numpy values included) to JSON, with ``orjson`` when available."""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option).decode()
+    return json.dumps(obj, cls=NumpyEncoder, indent=2 if indent else None)
+
+
+# per‑document results cache used when no ``content_cache_path`` is given
+DEFAULT_CONTENT_CACHE_PATH = (Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+                              / "mj_rag" / "content_cache.sqlite3")
+
+
+# markdown header prefixes of the levels 0 to 6, indexed by level
+_HEADER_PREFIXES = tuple(f"{'#' * level} " for level in range(7))
+
+
+@lru_cache(maxsize=4)
+def _get_encoding(model_name: str) -> tiktoken.Encoding:
+    """Return the (shared) tokenizer of *model_name*; loading its BPE ranks is costly.
+
+    Models unknown to tiktoken (e.g. local embedding models) fall back to
+    ``cl100k_base``, which is only used here to estimate token counts.
+    """
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _accepts_positional_args(method: Callable) -> bool:
+    try:
+        parameters = inspect.signature(method).parameters.values()
+    except (TypeError, ValueError):
+        return True
+    return any(parameter.kind is inspect.Parameter.VAR_POSITIONAL for parameter in parameters)
+
+
+def _log_preformatted(method: Callable, message: str, *args, **kwargs):
+    method(message % args if args else message, **kwargs)
+
+
+class _LoggingServiceAdapter:
+    """Let a user logging service receive the ``(message, *args)`` calls of the façade.
+
+    Services written against the original ``(message, **kwargs)`` signature
+    get the message %‑formatted beforehand, and those without ``isEnabledFor``
+    are considered enabled for every level.
+    """
+
+    def __init__(self, logging_service):
+        self.logging_service = logging_service
+        self.isEnabledFor = getattr(logging_service, "isEnabledFor", lambda _: True)
+        for name in ("debug", "info", "warning", "error"):
+            method = getattr(logging_service, name)
+            if not _accepts_positional_args(method):
+                method = partial(_log_preformatted, method)
+            setattr(self, name, method)
+
+
+class _LazyJson:
+    """Defer the JSON dump of *obj* until a log record is actually emitted."""
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self) -> str:
+        return _json_dumps(self.obj, indent=True)
+
+
+def _json_loads(data: Union[str, bytes]):
+    """Parse JSON *data*; failures raise :class:`json.JSONDecodeError` in both code paths."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 class MJRagAlgorithm:
     """High‑level façade that implements the MJ‑RAG workflow.
 
@@ -102,43 +192,266 @@ class MJRagAlgorithm:
         for local development.
     logging_service : LoggingServiceInterface, optional
         Structured logger.  If not provided, :py:meth:`get_default_logging_service`
-        is called to create a colourful console logger.
+        is called to create a colourful console logger.  Services other than
+        :class:`logging.Logger` are wrapped so that the original
+        ``(message, **kwargs)`` signature keeps working.
     add_hierachized_titles : bool, default ``True``
         Whether to generate *virtual* section headers that include their parent
         hierarchy (e.g. ``"Parent – Child – Subchild"``) to increase recall
         during header‑based search.
+    speculative_min_score : float, optional
+        When set, :py:meth:`get_direct_answer` first queries the VDB with the
+        bare question.  If the best hit scores at least this value, the hits
+        are used as context and the alternates/hypothetical answers are not
+        generated at all.
+    max_concurrent_llm_calls : int, default ``4``
+        Upper bound on the number of independent LLM (or embedding) requests
+        dispatched in parallel by a single call of the façade.
+    embeddings_cache_path : str, optional
+        SQLite file in which the embeddings of the sentence windows are
+        persisted, keyed by model and text.  Disabled by default.  The service
+        of *vector_db_service* is not modified: to also cache the embeddings of
+        its queries and headers, construct it with a
+        :class:`~mj_rag.cache.CachedEmbeddingService` instead; its cache is then
+        reused and this argument ignored.
+    content_cache_path : str, optional
+        SQLite file holding the per‑document results (sentence windows, their
+        embeddings and the LLM section tree), keyed by document hash.  Entries
+        of the former ``content_to_*_cache`` directories are still read and
+        migrated on first access.  Defaults to :py:data:`DEFAULT_CONTENT_CACHE_PATH`,
+        in the user's cache directory; pass ``None`` to disable the cache.
+    llm_answers_cache_size : int, default ``4096``
+        Number of question classifications and answer checks memoised in
+        memory, so repeated questions skip these LLM round‑trips.
     **kwargs
         Forward‑compatibility hook for subclasses; currently unused.
     """
 
-    rgx_sentence_limiter = re.compile(r"((?:[\.\?!\n][\n ]+)|(?:\n))")
-    rgx_only_space = re.compile(r"^[\s\n]*$")
+    # the capturing group keeps the delimiters in the ``split`` output; the
+    # branches start with disjoint characters, the most frequent one first
+    rgx_sentence_limiter = re.compile(r"(\n[\n ]*|[.?!][\n ]+)")
     rgx_md_point = re.compile(r"- (.*)\n")
+    rgx_line_start_object = re.compile(r"^[ \t]*\{", re.MULTILINE)
+    rgx_line_start_list = re.compile(r"^[ \t]*\[", re.MULTILINE)
 
-    rgx_space = re.compile(r" ")
     rgx_2_lines = re.compile(r"\n{2,}")
 
+    # limits of a single embedding request (OpenAI's, the default provider)
+    EMBEDDING_MAX_INPUT_TOKENS = 8191
+    EMBEDDING_BATCH_MAX_TOKENS = 250000
+    EMBEDDING_BATCH_MAX_ITEMS = 2048
+
+    _RGX_LINE_START_JSON = {"{": rgx_line_start_object, "[": rgx_line_start_list}
+    _json_decoder = json.JSONDecoder()
+
+    # section match keys rendered in a context entry only when set
+    _CONTEXT_ENTRY_OPTIONAL_FIELDS = (
+        ("source_url", "Source url"),
+        ("source_author", "Source author"),
+        ("source_type", "Source type"),
+    )
+
+    # one‑file‑per‑document layout used before :py:attr:`content_cache`
+    _LEGACY_CACHE_DIRS = {
+        "json_tree": "content_to_json_cache",
+        "sentences": "content_to_sentence_cache",
+        "embeddings": "content_to_vector_cache",
+    }
+    _LEGACY_CACHE_SUFFIXES = {"json_tree": ".json", "sentences": ".json", "embeddings": ".npy"}
+
+    # kind of answer implied by an explicit mode (see :py:meth:`get_answer`)
+    _MODE_TO_KIND = {
+        SectionAnswerMode.FIRST_BEST_SUMMARY: "SUMMARY",
+        SectionAnswerMode.TOP_K_SUMMARY: "SUMMARY",
+        SectionAnswerMode.TOP_K_COMBINE: "COMBINE",
+    }
+
+    # name of the method turning the section matchs into an answer, per mode
+    _SECTION_MODE_HANDLERS = {
+        SectionAnswerMode.FIRST_BEST_RAW: "_answer_first_best_raw",
+        SectionAnswerMode.FIRST_BEST_SUMMARY: "_answer_first_best_summary",
+        SectionAnswerMode.TOP_K_RAW: "_answer_top_k_raw",
+        SectionAnswerMode.TOP_K_SUMMARY: "_answer_top_k_summary",
+        SectionAnswerMode.TOP_K_COMBINE: "_answer_top_k_combine",
+        SectionAnswerMode.TOP_K_RESTRANSCRIPT: "_answer_top_k_retranscript",
+    }
+
+    # prompts of the LLM helpers, filled with ``str.format``
+    _PROMPT_CLASSIFY = """The user is asking this question: "{question}".
+The answers to this question is inside a vector database. Your goal is to help us find these informations.
+        
+Based on user's question you must guess if the answer can fit in ONE sentence, FEW sentences or TOO MANY sentences.
+You must also guess which kind of answer will be the best for the user when the answer will be in 
+TOO MANY sentences: a SUMMARY of results found or a COMBINATION of these results.
+
+---------------------------------------
+
+Let me show you some examples:
+
+^^^^^^^^^^^^^^^^^^^^^^^^^^
+Question: What is the birth date of Donald Trump Junior
+Your answer: {{"reasoning": "The user is asking for a birth date which can be replied in one sentence", "number_of_sentences": "ONE"}}
+
+^^^^^^^^^^^^^^^^^^^^^^^^^^^
+Question: When did the conflict end?
+Your answer: {{"reasoning": "The user is asking for ...", "number_of_sentences": "ONE"}}
+
+^^^^^^^^^^^^^^^^^^^^^^^^^^^
+Question: How to cook a pizza?
+Your answer: {{"reasoning": "The user is asking for ...", "number_of_sentences": "FEW"}}
+
+^^^^^^^^^^^^^^^^^^^^^^^^^^^
+Question: What were the causes of Matthew departure?
+Your answer: {{"reasoning": "The user is asking for ...", "number_of_sentences": "FEW"}}
+
+^^^^^^^^^^^^^^^^^^^^^^^^^^^
+Question: Tell me everything you can find about Rust weaknesses
+Your answer: {{"reasoning": "The user is asking for ... and we must combine all the results", 
+"number_of_sentences": "TOO_MANY", "kind": "COMBINING"}}
+
+^^^^^^^^^^^^^^^^^^^^^^^^^^^
+Question: What can you tell me about Rust?
+Your answer: {{"reasoning": "The user is asking for a summary of everything we can find about Rust", 
+"number_of_sentences": "FEW", "kind": "SUMMARY"}}
+
+---------------------------------------
+
+{question}
+
+Your answer: """
+
+    _PROMPT_ALT_SECTION = """We are working on a document which the document is turning around '{work_title}'
+        
+Inside this document there is a section which header is: {section_header}
+Give us few alternate section headers that mean the same thing as '{section_header}'
+
+Answer with the following format:
+
+---------------------
+- alternative header 1
+- alternative header 2
+---------------------"""
+
+    _PROMPT_ALT_DOCS = """We are working on a subject wich turns around '{work_title}'
+
+We ask you to give us some SHORT document titles which subject turn around '{work_title}' 
+and which contains a section which header is {section_header}.
+These documents are broader and not specific to {section_header}.
+{section_header} is just a section in these documents.
+
+Answer with the following format:
+
+---------------------
+- alternative header 1
+- alternative header 2
+---------------------"""
+
+    _PROMPT_ALT_QUESTION = """Generate few alternative questions with the same meaning 
+for this question: {question}
+
+Answer with the following format:
+
+---------------------
+- alternative question 1
+- alternative question 2
+---------------------"""
+
+    _PROMPT_HYPO_ANSWER = """Generate few hypothetical answers with the same meaning 
+for this question: {question}
+
+Answer with the following format:
+
+---------------------
+- xxx yyy zzz...
+- mmm nnn ooo...
+---------------------"""
+
+    _PROMPT_HEADERS_FROM_Q = """"{question}" is the question of a user.
+The answer to this question is a section inside a document. We don't know 
+that section's header. Give us few section's headers which we will use to do 
+search in a vector database. Your generated headers must be SHORT.
+
+Answer with the following format:
+
+---------------------
+- alternative question 1
+- alternative question 2
+---------------------"""
+
     def __init__(self, work_title: str,
                  vector_db_service: VectorDBServiceInterface,
                  llm_service: LLMServiceInterface,
                  sql_db_service: SqlDBServiceInterface = None,
                  logging_service: LoggingServiceInterface = None,
                  add_hierachized_titles: bool = True,
+                 speculative_min_score: Optional[float] = None,
+                 max_concurrent_llm_calls: int = 4,
+                 embeddings_cache_path: Optional[str] = None,
+                 content_cache_path: Optional[Union[str, Path]] = DEFAULT_CONTENT_CACHE_PATH,
+                 llm_answers_cache_size: int = 4096,
                  **kwargs):
+        if max_concurrent_llm_calls < 1:
+            raise ValueError(f"max_concurrent_llm_calls must be at least 1, got {max_concurrent_llm_calls}")
         self.work_title: str = work_title
         self.vector_db_service: VectorDBServiceInterface = vector_db_service
+        if logging_service is not None and not isinstance(logging_service, (logging.Logger, logging.LoggerAdapter)):
+            logging_service = _LoggingServiceAdapter(logging_service)
         self.logging_service: LoggingServiceInterface = logging_service or self.get_default_logging_service()
         self.embedding_service: EmbeddingServiceInterface = self.vector_db_service.embedding_service
+        self.embedding_cache: Optional[EmbeddingsCache] = None
+        # a cache coming with the vector DB's service is left open by :py:meth:`close`
+        self._owns_embedding_cache: bool = False
+        if isinstance(self.embedding_service, CachedEmbeddingService):
+            self.embedding_cache = self.embedding_service.cache
+        elif embeddings_cache_path:
+            self.embedding_cache = EmbeddingsCache(embeddings_cache_path)
+            self._owns_embedding_cache = True
+            self.embedding_service = CachedEmbeddingService(self.embedding_service, self.embedding_cache)
         self.llm_service: LLMServiceInterface = llm_service
         self.sql_db_service: SqlDBServiceInterface = sql_db_service or self.get_default_sql_db_service()
         self.add_hierarchized_titles: bool = add_hierachized_titles
+        self.speculative_min_score: Optional[float] = speculative_min_score
+        self.max_concurrent_llm_calls: int = max_concurrent_llm_calls
+        # shared by every (nested) fan‑out of the façade, see :py:meth:`_call_with_permit`
+        self._concurrency_limit = threading.BoundedSemaphore(max_concurrent_llm_calls)
+        self._thread_state = threading.local()
+        self.content_cache: Optional[SqliteCache] = (SqliteCache(content_cache_path, table="content")
+                                                     if content_cache_path else None)
+        # the latest content cache entries, kept decoded when immutable
+        self._content_memory_cache = LRUCache(128)
+        self._classify_cache = LRUCache(llm_answers_cache_size)
+        self._answer_check_cache = LRUCache(llm_answers_cache_size)
+
+    def close(self):
+        """Close the SQLite caches opened by this instance."""
+        if self.content_cache is not None:
+            self.content_cache.close()
+        if self._owns_embedding_cache:
+            self.embedding_cache.close()
+
+    def __enter__(self) -> "MJRagAlgorithm":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def _encoding(self) -> tiktoken.Encoding:
+        """Tokenizer of the embedding model, resolved once per model name."""
+        return _get_encoding(self.embedding_service.model_name)
+
+    def _count_tokens(self, texts: List[str]) -> List[int]:
+        """Return the number of tokens of each of *texts*, tokenized as one batch."""
+        if not texts:
+            return []
+        return list(map(len, self._encoding.encode_batch(texts, num_threads=min(8, len(texts)))))
 
     def get_default_logging_service(self) -> LoggingServiceInterface:
         """Return a stdio when the caller did not supply one."""
         log_format: str = "[%(asctime)s] [%(levelname)s]  %(message)s - %(pathname)s#L%(lineno)s"
         log_date_format: str = "%d/%b/%Y %H:%M:%S"
         console = logging.getLogger(self.work_title)
-        console.setLevel(logging.DEBUG)
+        console.setLevel(logging.INFO)
         hdlr = logging.StreamHandler()
         hdlr.setFormatter(
             logging.Formatter(
@@ -146,7 +459,7 @@ class MJRagAlgorithm:
                 datefmt=log_date_format,
             )
         )
-        hdlr.setLevel(logging.DEBUG)
+        hdlr.setLevel(logging.INFO)
         console.addHandler(hdlr)
         return console
 
@@ -162,13 +475,20 @@ class MJRagAlgorithm:
                                source_type: Optional[str] = None,
                                doc_hash: Optional[str] = None,
                                ) -> str:
-        """Persist *markdown_content* into both the vector and SQL stores."""
-        self.save_text_as_set_in_vdb(markdown_content, source_title, source_author=source_author,
-                                     source_url=source_url, source_type=source_type,
-                                     doc_hash=doc_hash)
-        return self.save_text_as_titles_in_vdb(markdown_content, source_title, source_author=source_author,
-                                     source_url=source_url, source_type=source_type,
-                                     doc_hash=doc_hash)
+        """Persist *markdown_content* into both the vector and SQL stores.
+
+        The sentence‑set and the section‑title ingestions share no state, so
+        they run concurrently.
+        """
+        _, titles_doc_hash = self._run_concurrently(
+            (partial(self.save_text_as_set_in_vdb, markdown_content, source_title,
+                     source_author=source_author, source_url=source_url,
+                     source_type=source_type, doc_hash=doc_hash),),
+            (partial(self.save_text_as_titles_in_vdb, markdown_content, source_title,
+                     source_author=source_author, source_url=source_url,
+                     source_type=source_type, doc_hash=doc_hash),),
+        )
+        return titles_doc_hash
 
     def save_text_as_set_in_vdb(self, markdown_content: str,
                                 source_title: str,
@@ -240,7 +560,7 @@ class MJRagAlgorithm:
         # save the section in sql db
         self._save_sections_in_sql_db(doc_hash, sections)
         self.logging_service.debug("After saving in sql db")
-        self.logging_service.debug(json.dumps(sections, indent=2))
+        self.logging_service.debug("%s", _LazyJson(sections))
 
         # make the sections in row and without subsections
         sections = self._linearize_sections(sections)
@@ -249,7 +569,7 @@ class MJRagAlgorithm:
 
         self._remove_subsections_in_sections(sections)
         self.logging_service.debug("After saving in linearization")
-        self.logging_service.debug(json.dumps(sections, indent=2))
+        self.logging_service.debug("%s", _LazyJson(sections))
 
         # save the sections with their sql doc id in vector database
         self.vector_db_service.insert_section_headers(self.work_title, sections,
@@ -259,7 +579,8 @@ class MJRagAlgorithm:
         return doc_hash
 
     def get_direct_answer(self, question: str, use_alternates: bool = False,
-                          use_hypothetical_answers: bool = False) -> str:
+                          use_hypothetical_answers: bool = False,
+                          max_context_tokens: int = 3000) -> str:
         """Return a short direct answer to *question*.
 
         The method performs an *embedding‑only* lookup against the *sentence‑set*
@@ -271,19 +592,48 @@ class MJRagAlgorithm:
         injects a handful of synthetic answers as additional query vectors; this
         trick can surface sentences that contain confirming evidence rather than
         re‑phrased questions.
-        """
-        if use_alternates:
-            alternates = self._generate_question_alternates(question)
-        else:
-            alternates = None
 
-        if use_hypothetical_answers:
-            hypothetical_answers = self._generate_hypothetical_answers(question)
-        else:
-            hypothetical_answers = None
+        The snippets are passed best score first, in a compact format, up to
+        *max_context_tokens* tokens (see :py:meth:`_format_context`).
+
+        The LLM calls generating the alternates and the hypothetical answers are
+        independent, so they run concurrently.  See ``speculative_min_score``
+        for the VDB probe that can skip them; when it doesn't, its hits are
+        kept and only the generated queries are searched.
+        """
+        found_texts = None
+        probe_texts = None
+        if self.speculative_min_score is not None and (use_alternates or use_hypothetical_answers):
+            probe_texts = self.vector_db_service.get_possible_answers_from_question(self.work_title,
+                                                                                    question) or []
+            best_score = max((text.get('score') or 0.0 for text in probe_texts), default=None)
+            if best_score is not None and best_score >= self.speculative_min_score:
+                self.logging_service.debug("Speculative hit with best_score = %r", best_score)
+                found_texts = probe_texts
+
+        if found_texts is None:
+            calls = []
+            if use_alternates:
+                calls.append((self._generate_question_alternates, question))
+            if use_hypothetical_answers:
+                calls.append((self._generate_hypothetical_answers, question))
+            results = iter(self._run_concurrently(*calls))
+            alternates = next(results) if use_alternates else None
+            hypothetical_answers = next(results) if use_hypothetical_answers else None
+
+            # the LLM often paraphrases back the question itself or repeats itself
+            seen = {self._canonical_text(question)}
+            alternates = self._dedupe_queries(alternates, seen) if alternates is not None else None
+            hypothetical_answers = (self._dedupe_queries(hypothetical_answers, seen)
+                                    if hypothetical_answers is not None else None)
+            if probe_texts is None:
+                found_texts = self.vector_db_service.get_possible_answers_from_question(self.work_title, question,
+                                            alternates=alternates, hypothetical_answers=hypothetical_answers)
+            else:
+                # the probe already searched the bare question: only the generated queries are left
+                found_texts = probe_texts + self._search_generated_queries(alternates or [],
+                                                                           hypothetical_answers or [])
 
-        found_texts = self.vector_db_service.get_possible_answers_from_question(self.work_title, question,
-                                    alternates=alternates, hypothetical_answers=hypothetical_answers)
         messages = [
             {
                 "role": "system",
@@ -291,7 +641,7 @@ class MJRagAlgorithm:
             },
             {
                 "role": "user",
-                "content": f"Context:\n\n{json.dumps(found_texts)}"
+                "content": f"Context:\n\n{self._format_context(found_texts or [], max_context_tokens)}"
             },
             {
                 "role": "user",
@@ -302,6 +652,47 @@ class MJRagAlgorithm:
         answer = self.llm_service.complete_messages(messages)
         return answer
 
+    def _search_generated_queries(self, alternates: List[str], hypothetical_answers: List[str]) -> List[dict]:
+        """Search the VDB with the generated queries only, the first one standing for the question."""
+        if alternates:
+            return self.vector_db_service.get_possible_answers_from_question(
+                self.work_title, alternates[0], alternates=alternates[1:],
+                hypothetical_answers=hypothetical_answers) or []
+        if hypothetical_answers:
+            return self.vector_db_service.get_possible_answers_from_question(
+                self.work_title, hypothetical_answers[0], hypothetical_answers=hypothetical_answers[1:]) or []
+        return []
+
+    def _format_context(self, found_texts: List[dict], max_tokens: int = 3000) -> str:
+        """Render the VDB hits as ``[#n src=…] text`` lines, best first, within *max_tokens*.
+
+        Only the text and its source metadata are kept; the same text found by
+        several queries is included once.  The best hit is always included.
+        """
+        entries = []
+        seen_texts = set()
+        for found_text in sorted(found_texts, key=lambda found: found.get('score') or 0.0, reverse=True):
+            text = found_text.get('text')
+            if not text or text in seen_texts:
+                continue
+            seen_texts.add(text)
+
+            source = f"src={found_text.get('source_title') or ''}"
+            if found_text.get('source_url'):
+                source += f" url={found_text['source_url']}"
+            if found_text.get('source_author'):
+                source += f" author={found_text['source_author']}"
+            entries.append(f"[#{len(entries) + 1} {source}] {text}")
+
+        tokens_count = 0
+        for i, entry_tokens_count in enumerate(self._count_tokens(entries)):
+            if i and tokens_count + entry_tokens_count > max_tokens:
+                entries = entries[:i]
+                break
+            tokens_count += entry_tokens_count
+
+        return "\n".join(entries)
+
     def get_section_as_answer_from_header(self, section_header: str, use_alternates: bool = True,
                                           mode: SectionAnswerMode = SectionAnswerMode.TOP_K_COMBINE,
                                           known_document_titles: List[str] = None,
@@ -312,20 +703,18 @@ class MJRagAlgorithm:
         relevant section title.
         """
         if use_alternates:
-            alternates = self._generate_section_alternates(section_header)
-            if known_document_titles:
-                document_titles: List[str] = known_document_titles
-            else:
-                document_titles = self._generate_documents_for_section_alternates(section_header)
+            alternates, document_titles = self._generate_section_and_documents_alternates(
+                section_header, known_document_titles)
 
             header_alternates = []
             for doc_title in document_titles:
                 for header in alternates:
                     header_alternates.append(f"{doc_title} - {header}")
+            header_alternates = self._dedupe_queries(header_alternates, {self._canonical_text(section_header)})
         else:
             header_alternates = []
 
-        self.logging_service.debug(f"{header_alternates = }")
+        self.logging_service.debug("header_alternates = %r", header_alternates)
 
         matchs = self.vector_db_service.get_possible_matchs_from_header(self.work_title, self.sql_db_service,
                             section_header, alternates=header_alternates, top_k=top_k)
@@ -338,18 +727,16 @@ class MJRagAlgorithm:
         """Infer probable section headers *from* the question, then delegate to header search."""
         possible_headers = self._generate_possible_headers_from_question(question)
         if use_alternates:
-            alternates = self._generate_section_alternates(possible_headers[0])
-            if known_document_titles:
-                document_titles: List[str] = known_document_titles
-            else:
-                document_titles = self._generate_documents_for_section_alternates(possible_headers[0])
+            alternates, document_titles = self._generate_section_and_documents_alternates(
+                possible_headers[0], known_document_titles)
 
             for doc_title in document_titles:
                 for header in alternates:
                     possible_headers.append(f"{doc_title} - {header}")
 
+        possible_headers = self._dedupe_queries(possible_headers, set())
         header = possible_headers.pop(0)
-        self.logging_service.debug(f"{header = } {possible_headers = }")
+        self.logging_service.debug("header = %r possible_headers = %r", header, possible_headers)
 
         matchs = self.vector_db_service.get_possible_matchs_from_header(self.work_title, self.sql_db_service,
                             header, alternates=possible_headers, top_k=top_k)
@@ -361,17 +748,12 @@ class MJRagAlgorithm:
         """One‑stop shop: decide the best strategy and return an answer to *question*."""
         if number_of_sentences is None:
             classified_answer = self._classify_answer_for_question(question)
-            self.logging_service.info(f"{classified_answer = }")
+            self.logging_service.info("classified_answer = %r", classified_answer)
 
             number_of_sentences = classified_answer['number_of_sentences'].upper()
             kind = classified_answer['kind'].upper() if 'kind' in classified_answer else None
         else:
-            if mode == SectionAnswerMode.FIRST_BEST_SUMMARY or mode == SectionAnswerMode.TOP_K_SUMMARY:
-                kind = "SUMMARY"
-            elif mode == SectionAnswerMode.TOP_K_COMBINE == "COMBINE":
-                kind = "COMBINE"
-            else:
-                kind = None
+            kind = self._MODE_TO_KIND.get(mode)
 
         if number_of_sentences == "ONE":
             return self.get_direct_answer(question, use_alternates=True,
@@ -379,9 +761,9 @@ class MJRagAlgorithm:
         elif number_of_sentences == "FEW":
             first_answer = self.get_direct_answer(question, use_alternates=True,
                                           use_hypothetical_answers=True)
-            self.logging_service.debug(f"{first_answer = }")
+            self.logging_service.debug("first_answer = %r", first_answer)
             is_good = self.check_if_answer_is_correct(question, first_answer)
-            self.logging_service.debug(f"{is_good = }")
+            self.logging_service.debug("is_good = %r", is_good)
             if is_good:
                 return first_answer
 
@@ -412,7 +794,11 @@ class MJRagAlgorithm:
         """Ask the LLM to sanity‑check *answer* against *question*.
 
         Returns ``True`` if the LLM replies with *yes*, ``False`` otherwise.
+        Verdicts are memoised per ``(question, answer)`` pair.
         """
+        cached = self._answer_check_cache.get((question, answer))
+        if cached is not None:
+            return cached
 
         msg_content = f"""We are working on a document which the document is turning around '{self.work_title}'
 
@@ -426,88 +812,76 @@ Is the assitant's answer looks like a good answer? Reply by YES or NO"""
             {"role": "user", "content": msg_content}
         ]
         to_parse = self.llm_service.complete_messages(messages)
-        if 'yes' in to_parse.lower():
-            return True
-        else:
-            return False
+        is_correct = 'yes' in to_parse.lower()
+        self._answer_check_cache.set((question, answer), is_correct)
+        return is_correct
 
     def _classify_answer_for_question(self, question: str) -> dict:
-        msg_content = f"""The user is asking this question: "{question}".
-The answers to this question is inside a vector database. Your goal is to help us find these informations.
-        
-Based on user's question you must guess if the answer can fit in ONE sentence, FEW sentences or TOO MANY sentences.
-You must also guess which kind of answer will be the best for the user when the answer will be in 
-TOO MANY sentences: a SUMMARY of results found or a COMBINATION of these results.
+        # case and spacing don't change the classification
+        cache_key = self._canonical_text(question)
+        cached = self._classify_cache.get(cache_key)
+        if cached is not None:
+            self.logging_service.debug("Classification cache hit (%d hits, %d misses)",
+                                       self._classify_cache.hits, self._classify_cache.misses)
+            return dict(cached)
 
----------------------------------------
-
-Let me show you some examples:
-
-^^^^^^^^^^^^^^^^^^^^^^^^^^
-Question: What is the birth date of Donald Trump Junior
-Your answer: {{"reasoning": "The user is asking for a birth date which can be replied in one sentence", "number_of_sentences": "ONE"}}
-
-^^^^^^^^^^^^^^^^^^^^^^^^^^^
-Question: When did the conflict end?
-Your answer: {{"reasoning": "The user is asking for ...", "number_of_sentences": "ONE"}}
-
-^^^^^^^^^^^^^^^^^^^^^^^^^^^
-Question: How to cook a pizza?
-Your answer: {{"reasoning": "The user is asking for ...", "number_of_sentences": "FEW"}}
-
-^^^^^^^^^^^^^^^^^^^^^^^^^^^
-Question: What were the causes of Matthew departure?
-Your answer: {{"reasoning": "The user is asking for ...", "number_of_sentences": "FEW"}}
-
-^^^^^^^^^^^^^^^^^^^^^^^^^^^
-Question: Tell me everything you can find about Rust weaknesses
-Your answer: {{"reasoning": "The user is asking for ... and we must combine all the results", 
-"number_of_sentences": "TOO_MANY", "kind": "COMBINING"}}
-
-^^^^^^^^^^^^^^^^^^^^^^^^^^^
-Question: What can you tell me about Rust?
-Your answer: {{"reasoning": "The user is asking for a summary of everything we can find about Rust", 
-"number_of_sentences": "FEW", "kind": "SUMMARY"}}
-
----------------------------------------
-
-{question}
-
-Your answer: """
+        msg_content = self._PROMPT_CLASSIFY.format(question=question)
 
         messages = [
             {"role": "user", "content": msg_content}
         ]
         to_parse = self.llm_service.complete_messages(messages)
         self.logging_service.debug(to_parse)
-        return self._extract_to_json_object(to_parse)
+        classified_answer = self._extract_to_json_object(to_parse)
+        # a malformed classification would otherwise be served until evicted
+        if self._is_valid_classification(classified_answer):
+            self._classify_cache.set(cache_key, classified_answer)
+        return dict(classified_answer)
+
+    @staticmethod
+    def _is_valid_classification(classified_answer) -> bool:
+        return (isinstance(classified_answer, dict)
+                and isinstance(classified_answer.get('number_of_sentences'), str)
+                and classified_answer['number_of_sentences'].upper() in ("ONE", "FEW", "TOO_MANY")
+                and isinstance(classified_answer.get('kind', ""), str))
 
     def _process_section_matchs(self, matchs: List[dict], mode: SectionAnswerMode,
                                 top_k:int=5, question: str = None) -> str:
-        if mode == SectionAnswerMode.FIRST_BEST_RAW:
-            return self._get_content_from_sql_db_from_id(matchs[0]['sql_doc_id'])
-        elif mode == SectionAnswerMode.FIRST_BEST_SUMMARY:
-            return self.generate_summary_from_context_entries(
-                [self._section_match_to_context_entry(matchs[0])]
-            )
-        elif mode == SectionAnswerMode.TOP_K_RAW:
-            return self.format_context_entries(
-                [self._section_match_to_context_entry(match) for match in matchs[:top_k]]
-            )
-        elif mode == SectionAnswerMode.TOP_K_SUMMARY:
-            return self.generate_summary_from_context_entries(
-                [self._section_match_to_context_entry(match) for match in matchs[:top_k]]
-            )
-        elif mode == SectionAnswerMode.TOP_K_COMBINE:
-            return self.combine_context_entries(
-                [self._section_match_to_context_entry(match) for match in matchs[:top_k]],
-                question=question
-            )
-        elif mode == SectionAnswerMode.TOP_K_RESTRANSCRIPT:
-            return self.generate_retranscript_from_context_entries(
-                [self._section_match_to_context_entry(match) for match in matchs[:top_k]],
-                question=question
-            )
+        try:
+            handler_name = self._SECTION_MODE_HANDLERS[mode]
+        except KeyError:
+            raise ValueError(f"Unsupported section answer mode '{mode}'") from None
+        return getattr(self, handler_name)(matchs, top_k=top_k, question=question)
+
+    def _answer_first_best_raw(self, matchs: List[dict], top_k: int = 5, question: str = None) -> str:
+        return self._get_content_from_sql_db_from_id(matchs[0]['sql_doc_id'])
+
+    def _answer_first_best_summary(self, matchs: List[dict], top_k: int = 5, question: str = None) -> str:
+        return self.generate_summary_from_context_entries(
+            [self._section_match_to_context_entry(matchs[0])]
+        )
+
+    def _answer_top_k_raw(self, matchs: List[dict], top_k: int = 5, question: str = None) -> str:
+        return self.format_context_entries(
+            [self._section_match_to_context_entry(match) for match in matchs[:top_k]]
+        )
+
+    def _answer_top_k_summary(self, matchs: List[dict], top_k: int = 5, question: str = None) -> str:
+        return self.generate_summary_from_context_entries(
+            [self._section_match_to_context_entry(match) for match in matchs[:top_k]]
+        )
+
+    def _answer_top_k_combine(self, matchs: List[dict], top_k: int = 5, question: str = None) -> str:
+        return self.combine_context_entries(
+            [self._section_match_to_context_entry(match) for match in matchs[:top_k]],
+            question=question
+        )
+
+    def _answer_top_k_retranscript(self, matchs: List[dict], top_k: int = 5, question: str = None) -> str:
+        return self.generate_retranscript_from_context_entries(
+            [self._section_match_to_context_entry(match) for match in matchs[:top_k]],
+            question=question
+        )
 
     def _section_match_to_context_entry(self, section_match: dict) -> str:
         header: str = section_match['header']
@@ -518,56 +892,111 @@ Your answer: """
             parents_hierarchy = " -> ".join(parents)
         else:
             parents_hierarchy = ""
-        content = f"Header: {header}\nParents Hierarchy: {parents_hierarchy}"
-        content += f"\nLevel: {section_match['level']}\nSemantic score: {section_match['score']}"
-        content += f"\nSource title: {section_match['source_title']}"
-        if section_match.get('source_url'):
-            content += f"\nSource url: {section_match['source_url']}"
-        if section_match.get('source_author'):
-            content += f"\nSource author: {section_match['source_author']}"
-        if section_match.get('source_type'):
-            content += f"\nSource type: {section_match['source_type']}"
-        content += f"\nContent: {section_match['content']}"
-        return content
+        parts = [
+            f"Header: {header}",
+            f"Parents Hierarchy: {parents_hierarchy}",
+            f"Level: {section_match['level']}",
+            f"Semantic score: {section_match['score']}",
+            f"Source title: {section_match['source_title']}",
+        ]
+        for key, label in self._CONTEXT_ENTRY_OPTIONAL_FIELDS:
+            value = section_match.get(key)
+            if value:
+                parts.append(f"{label}: {value}")
+        parts.append(f"Content: {section_match['content']}")
+        return "\n".join(parts)
 
     def _get_content_from_sql_db_from_id(self, doc_id: str) -> str:
         return self.sql_db_service.get_content_from_id(self.work_title, doc_id)
 
-    def _generate_section_alternates(self, section_header: str) -> List[str]:
-        msg_content = f"""We are working on a document which the document is turning around '{self.work_title}'
-        
-Inside this document there is a section which header is: {section_header}
-Give us few alternate section headers that mean the same thing as '{section_header}'
+    def _run_concurrently(self, *calls: Tuple[Callable, ...]) -> List[Any]:
+        """Run each ``(func, *args)`` of *calls* on a bounded thread pool.
 
-Answer with the following format:
+        The results are returned in the order of *calls*; the first exception
+        raised by a call is propagated.  Nested calls share the
+        ``max_concurrent_llm_calls`` limit of the façade.
+        """
+        if not calls:
+            return []
+        if len(calls) == 1:
+            func, *args = calls[0]
+            if getattr(self._thread_state, "holding_permit", False):
+                return [func(*args)]
+            return [self._call_with_permit(func, *args)]
+
+        with self._waiting_for_subtasks(), \
+                ThreadPoolExecutor(max_workers=min(len(calls), self.max_concurrent_llm_calls)) as executor:
+            futures = [executor.submit(self._call_with_permit, *call) for call in calls]
+            return [future.result() for future in futures]
+
+    def _call_with_permit(self, func: Callable, *args) -> Any:
+        """Call *func* once one of the ``max_concurrent_llm_calls`` permits is free."""
+        with self._concurrency_limit:
+            self._thread_state.holding_permit = True
+            try:
+                return func(*args)
+            finally:
+                self._thread_state.holding_permit = False
 
----------------------
-- alternative header 1
-- alternative header 2
----------------------"""
+    @contextmanager
+    def _waiting_for_subtasks(self):
+        """Give back the permit of the current thread while it waits for its subtasks.
+
+        Without it, nested fan‑outs could exhaust the permits with waiting
+        parents and deadlock.
+        """
+        holding_permit = getattr(self._thread_state, "holding_permit", False)
+        if holding_permit:
+            self._concurrency_limit.release()
+            self._thread_state.holding_permit = False
+        try:
+            yield
+        finally:
+            if holding_permit:
+                self._concurrency_limit.acquire()
+                self._thread_state.holding_permit = True
+
+    @staticmethod
+    def _canonical_text(text: str) -> str:
+        """Return *text* case‑folded and with its whitespace runs collapsed."""
+        return " ".join(text.split()).casefold()
+
+    def _dedupe_queries(self, queries: List[str], seen: set) -> List[str]:
+        """Drop the *queries* whose canonical form is already in *seen* (which is updated)."""
+        unique = []
+        for query in queries:
+            canonical = self._canonical_text(query)
+            if canonical not in seen:
+                seen.add(canonical)
+                unique.append(query)
+        return unique
+
+    def _generate_section_and_documents_alternates(self, section_header: str,
+                                                   known_document_titles: List[str] = None
+                                                   ) -> Tuple[List[str], List[str]]:
+        """Return the alternates of *section_header* and the document titles to prefix them with."""
+        if known_document_titles:
+            return self._generate_section_alternates(section_header), known_document_titles
+
+        alternates, document_titles = self._run_concurrently(
+            (self._generate_section_alternates, section_header),
+            (self._generate_documents_for_section_alternates, section_header),
+        )
+        return alternates, document_titles
+
+    def _generate_section_alternates(self, section_header: str) -> List[str]:
+        msg_content = self._PROMPT_ALT_SECTION.format(work_title=self.work_title, section_header=section_header)
 
         messages = [
             {"role": "user", "content": msg_content}
         ]
         to_parse = self.llm_service.complete_messages(messages)
         headers = self._extract_points(to_parse)
-        self.logging_service.debug(f"{headers}")
+        self.logging_service.debug("%s", headers)
         return headers
 
     def _generate_documents_for_section_alternates(self, section_header: str) -> List[str]:
-        msg_content = f"""We are working on a subject wich turns around '{self.work_title}'
-
-We ask you to give us some SHORT document titles which subject turn around '{self.work_title}' 
-and which contains a section which header is {section_header}.
-These documents are broader and not specific to {section_header}.
-{section_header} is just a section in these documents.
-
-Answer with the following format:
-
----------------------
-- alternative header 1
-- alternative header 2
----------------------"""
+        msg_content = self._PROMPT_ALT_DOCS.format(work_title=self.work_title, section_header=section_header)
 
         messages = [
             {"role": "user", "content": msg_content}
@@ -575,26 +1004,18 @@ Answer with the following format:
         to_parse = self.llm_service.complete_messages(messages)
         doc_titles = self._extract_points(to_parse)
         doc_titles = [doc_title.split(':')[0].strip() for doc_title in doc_titles]
-        self.logging_service.debug(f"{doc_titles}")
+        self.logging_service.debug("%s", doc_titles)
         return doc_titles
 
     def _generate_question_alternates(self, question: str) -> List[str]:
-        msg_content = f"""Generate few alternative questions with the same meaning 
-for this question: {question}
-
-Answer with the following format:
-
----------------------
-- alternative question 1
-- alternative question 2
----------------------"""
+        msg_content = self._PROMPT_ALT_QUESTION.format(question=question)
 
         messages = [
             {"role": "user", "content": msg_content}
         ]
         to_parse = self.llm_service.complete_messages(messages)
         points = self._extract_points(to_parse)
-        self.logging_service.debug(f"{points}")
+        self.logging_service.debug("%s", points)
         return points
 
     def _generate_hypothetical_answers(self, question: str) -> List[str]:
@@ -604,62 +1025,59 @@ Answer with the following format:
         not the exact phrasing of the query.
         """
 
-        msg_content = f"""Generate few hypothetical answers with the same meaning 
-for this question: {question}
-
-Answer with the following format:
-
----------------------
-- xxx yyy zzz...
-- mmm nnn ooo...
----------------------"""
+        msg_content = self._PROMPT_HYPO_ANSWER.format(question=question)
 
         messages = [
             {"role": "user", "content": msg_content}
         ]
         to_parse = self.llm_service.complete_messages(messages)
         points = self._extract_points(to_parse)
-        self.logging_service.debug(f"{points}")
+        self.logging_service.debug("%s", points)
         return points
 
     def _generate_possible_headers_from_question(self, question: str) -> List[str]:
-        msg_content = f""""{question}" is the question of a user.
-The answer to this question is a section inside a document. We don't know 
-that section's header. Give us few section's headers which we will use to do 
-search in a vector database. Your generated headers must be SHORT.
-
-Answer with the following format:
-
----------------------
-- alternative question 1
-- alternative question 2
----------------------"""
+        msg_content = self._PROMPT_HEADERS_FROM_Q.format(question=question)
 
         messages = [
             {"role": "user", "content": msg_content}
         ]
         to_parse = self.llm_service.complete_messages(messages)
         points = self._extract_points(to_parse)
-        self.logging_service.debug(f"{points}")
+        self.logging_service.debug("%s", points)
         return points
 
     def _extract_points(self, content: str) -> List[str]:
-        res = [point.strip() for point in self.rgx_md_point.findall(content)]
-        res = [point for point in res if point]
-        return res
+        return [point for point in map(str.strip, self.rgx_md_point.findall(content)) if point]
 
     def _extract_to_json_object(self, response: str):
-        nester_expr = originalTextFor(lineStart + nestedExpr("{", "}"))
-        results = nester_expr.search_string(response)
-        return json.loads(results.as_list()[0][0])
+        return self._extract_json(response, "{")
+
+    def _extract_json(self, response: str, open_char: str):
+        """Decode the first JSON value of *response* opening with *open_char* at a line start.
+
+        Candidates that fail to decode are skipped; if none decodes, the error
+        of the first one is raised (:class:`json.JSONDecodeError`).
+        """
+        first_error = None
+        for match in self._RGX_LINE_START_JSON[open_char].finditer(response):
+            try:
+                return self._json_decoder.raw_decode(response, match.end() - 1)[0]
+            except json.JSONDecodeError as e:
+                first_error = first_error or e
+
+        if first_error is not None:
+            raise first_error
+        raise json.JSONDecodeError(f"No JSON value starting with {open_char!r} found", response, 0)
 
     def split_content_with_llm(self, content: str, title: str = None,
-                               doc_hash: Optional[str] = None) -> Tuple[str, List[dict]]:
+                               doc_hash: Optional[str] = None,
+                               retry_timeout: float = 300.0) -> Tuple[str, List[dict]]:
         """Ask the LLM to parse *content* into a *header/content* JSON tree.
 
         Results are cached on disk (see :py:meth:`get_cached_content_json_tree`) so
         that repeated ingestion of the same document does not incur extra token
-        costs.
+        costs.  Invalid JSON responses are retried up to 5 times, but no new try
+        is started once *retry_timeout* seconds have elapsed.
         """
         hash, res = self.get_cached_content_json_tree(content, doc_hash=doc_hash)
         if res:
@@ -705,13 +1123,15 @@ Text:
 {content}
 -------"""
 
-        encoding = tiktoken.encoding_for_model(self.embedding_service.model_name)
-        tokens_count = len(encoding.encode(prompt))
+        tokens_count = len(self._encoding.encode(prompt))
         if tokens_count > 100000:
             raise ValueError(f"TOO MANY TOKENS {tokens_count = }")
 
+        # only the last two errors are sent back, so the retried prompts don't keep growing
+        deadline = time.monotonic() + retry_timeout
         errors = []
-        for _ in range(5):
+        resp = None
+        for tries in range(1, 6):
             try:
                 messages = [{'role': 'user', 'content': prompt}]
                 messages.extend(errors)
@@ -719,15 +1139,24 @@ Text:
                 resp = self.parse_llm_response_to_json_list(response)
                 break
             except json.JSONDecodeError as e:
-                errors.append({'role': 'user', 'content': f"Your response is not valid JSON: {e}"})
-        else:
-            raise ValueError("The LLM can't return valid JSON after 5 tries.")
+                if e.doc.strip() and (e.msg.startswith("Unterminated string") or e.pos >= 0.9 * len(e.doc)):
+                    # the response was most likely cut by the output token limit
+                    error = ("Your response was truncated before the end of the JSON. Return the "
+                             "complete JSON again, without indentation nor any text around it.")
+                else:
+                    error = f"Your response is not valid JSON: {e}"
+                errors = errors[-1:] + [{'role': 'user', 'content': error}]
+            if time.monotonic() >= deadline:
+                break
+        if resp is None:
+            raise ValueError(f"The LLM can't return valid JSON after {tries} tries.")
 
-        self.logging_service.debug("Before enriching section")
-        self.logging_service.debug(json.dumps(resp, indent=2))
+        debug_enabled = self.logging_service.isEnabledFor(logging.DEBUG)
+        if debug_enabled:
+            self.logging_service.debug("Before enriching section\n%s", _LazyJson(resp))
         resp = self.enrich_sections(resp)
-        self.logging_service.debug("After enriching section")
-        self.logging_service.debug(json.dumps(resp, indent=2))
+        if debug_enabled:
+            self.logging_service.debug("After enriching section\n%s", _LazyJson(resp))
         self.save_in_cache_content_json_tree(hash, resp)
         return hash, resp
 
@@ -740,44 +1169,54 @@ Text:
         if not markdown_content:
             raise ValueError("Empty content")
 
-        encoding = tiktoken.encoding_for_model(self.embedding_service.model_name)
-
         # split the content in sentences
-        lines = [senten.strip() for senten in self.rgx_sentence_limiter.split(markdown_content)
-                 if senten.strip()]
-        for line in lines:
-            # tokens_count = len(encoding.encode(line))
-            self.logging_service.debug(line)
+        lines = self._split_sentences(markdown_content)
+        debug_enabled = self.logging_service.isEnabledFor(logging.DEBUG)
+        if debug_enabled:
+            for line in lines:
+                self.logging_service.debug(line)
 
         # build the sentences set
-        total_lines = len(lines)
-        sentences_set = []
-        for i in range(0, total_lines - 3, 2):
-            step = i + (count * 2)
-            sentence = ""
-            for j, part in enumerate(lines[i:step]):
-                if self.rgx_sentence_limiter.match(part):
-                    sentence = f"{sentence}{part}"
-                else:
-                    sentence = f"{sentence} {part}"
-            sentences_set.append(sentence)
+        sentences_set = self._make_windows(lines, count)
 
-        max_tokens_count = 0
-        for sentence in sentences_set:
-            tokens_count = len(encoding.encode(sentence))
-            max_tokens_count = max(max_tokens_count, tokens_count)
-            self.logging_service.debug(f"===> {tokens_count} {sentence}")
+        tokens_counts = self._count_tokens(sentences_set)
+        if debug_enabled:
+            for tokens_count, sentence in zip(tokens_counts, sentences_set):
+                self.logging_service.debug("===> %s %s", tokens_count, sentence)
+        max_tokens_count = max(tokens_counts, default=0)
 
-        self.logging_service.info(f"{max_tokens_count = }")
+        self.logging_service.info("max_tokens_count = %r", max_tokens_count)
         self.save_in_cache_content_sentences(hash, sentences_set)
         return hash, sentences_set
 
+    def _split_sentences(self, content: str) -> List[str]:
+        """Return the stripped, non-empty sentences and delimiters of *content*, in order."""
+        parts = []
+        position = 0
+        for match in self.rgx_sentence_limiter.finditer(content):
+            parts.append(content[position:match.start()].strip())
+            parts.append(match.group().strip())
+            position = match.end()
+        parts.append(content[position:].strip())
+        return [part for part in parts if part]
+
+    def _make_windows(self, lines: List[str], count: int) -> List[str]:
+        """Join *lines* (sentences and their delimiters) into overlapping windows.
+
+        Each window holds *count* sentences and starts one sentence after the
+        previous one.  Every part, delimiters included, is preceded by a space:
+        the windows are cached and stored in the VDB, so their text must not
+        change between versions.
+        """
+        return [" " + " ".join(lines[i:i + (count * 2)])
+                for i in range(0, len(lines) - 3, 2)]
+
     def generate_summary_from_context_entries(self, context_entries: List[str]) -> str:
         msg_content = f"""Generate a summary of the following context and cite your sources
 
 {self.format_context_entries(context_entries)}"""
 
-        self.logging_service.debug(f"{msg_content = }")
+        self.logging_service.debug("msg_content = %r", msg_content)
 
         messages = [
             {"role": "user", "content": msg_content}
@@ -828,187 +1267,197 @@ this question: {question}
         return f"++++++++++++++++\n{ctx}\n++++++++++++++++"
 
     def get_cached_content_json_tree(self, content: str, doc_hash: Optional[str] = None) -> Tuple[str, Optional[List[dict]]]:
-        cache_dir = Path('content_to_json_cache')
-        if not cache_dir.exists():
-            cache_dir.mkdir()
-
         hash = self.get_doc_hash(content) if not doc_hash else doc_hash
-
-        self.logging_service.debug(f"{hash = }")
-
-        cache_file = cache_dir / f"{hash}.json"
-        if cache_file.exists():
-            with cache_file.open() as fp:
-                res = json.load(fp)
-                return hash, res
-        else:
-            return hash, None
+        return hash, self._load_cached("json_tree", hash)
 
     def get_cached_content_embeddings(self, content: Optional[str] = None,
-                                      doc_hash: Optional[str] = None)  -> Tuple[str, Optional[List[dict]]]:
-        cache_dir = Path('content_to_vector_cache')
-        if not cache_dir.exists():
-            cache_dir.mkdir()
-
-        if not doc_hash:
-            hash = self.get_doc_hash(content)
-        else:
-            hash = doc_hash
-
-        self.logging_service.debug(f"{hash = }")
-
-        cache_file = cache_dir / f"{hash}.npy"
-        if cache_file.exists():
-            res = np.load(str(cache_file))
-            return hash, res
-        else:
-            return hash, None
-
-    def get_cached_content_sentences(self, content: str, doc_hash: Optional[str] = None) -> Tuple[str, Optional[List[dict]]]:
-        cache_dir = Path('content_to_sentence_cache')
-        if not cache_dir.exists():
-            cache_dir.mkdir()
-
+                                      doc_hash: Optional[str] = None)  -> Tuple[str, Optional[np.ndarray]]:
         hash = self.get_doc_hash(content) if not doc_hash else doc_hash
+        return hash, self._load_cached("embeddings", hash)
 
-        self.logging_service.debug(f"{hash = }")
-
-        cache_file = cache_dir / f"{hash}.json"
-        if cache_file.exists():
-            with cache_file.open() as fp:
-                res = json.load(fp)
-                return hash, res
-        else:
-            return hash, None
+    def get_cached_content_sentences(self, content: str, doc_hash: Optional[str] = None) -> Tuple[str, Optional[List[str]]]:
+        hash = self.get_doc_hash(content) if not doc_hash else doc_hash
+        return hash, self._load_cached("sentences", hash)
 
     def get_doc_hash(self, content: str) -> str:
-        from hashlib import sha256
-        content = self.rgx_space.sub('', content)
-        content = self.rgx_2_lines.sub('\n', content)
+        # the hash is persisted (caches, SQL and vector DBs): keep this normalisation as is
+        content = content.replace(' ', '')
+        if '\n\n' in content:
+            content = self.rgx_2_lines.sub('\n', content)
 
-        m = sha256(content.encode())
-        return m.hexdigest()
+        return sha256(content.encode()).hexdigest()
 
     def save_in_cache_content_json_tree(self, hash: str, json_tree: List[dict]):
-        cache_dir = Path('content_to_json_cache')
-        if not cache_dir.exists():
-            cache_dir.mkdir()
-
-        cache_file = cache_dir / f"{hash}.json"
-        with cache_file.open('w') as fp:
-            fp.write(json.dumps(json_tree, indent=2))
+        self._save_cached("json_tree", hash, json_tree)
 
     def save_in_cache_content_embeddings(self, hash: str, embeddings: np.ndarray):
-        cache_dir = Path('content_to_vector_cache')
-        if not cache_dir.exists():
-            cache_dir.mkdir()
-
-        cache_file = cache_dir / f"{hash}.npy"
-        np.save(str(cache_file), embeddings)
+        """Cache *embeddings* as ``float16``; they are read back in that dtype."""
+        self._save_cached("embeddings", hash, embeddings)
 
     def save_in_cache_content_sentences(self, hash: str, sentences_set: List[str]):
-        cache_dir = Path('content_to_sentence_cache')
-        if not cache_dir.exists():
-            cache_dir.mkdir()
+        self._save_cached("sentences", hash, sentences_set)
+
+    def _load_cached(self, kind: str, hash: str):
+        """Return the cached *kind* result of the document *hash*, or ``None``.
 
-        cache_file = cache_dir / f"{hash}.json"
-        with cache_file.open('w') as fp:
-            fp.write(json.dumps(sentences_set, indent=2))
+        Entries only found in the legacy one‑file‑per‑document directories are
+        copied into :py:attr:`content_cache`.
+        """
+        self.logging_service.debug("hash = %r", hash)
+        if self.content_cache is None:
+            return None
+
+        key = f"{kind}:{hash}"
+        value = self._content_memory_cache.get(key)
+        if value is None:
+            value = self.content_cache.get(key)
+            if value is None:
+                legacy_file = Path(self._LEGACY_CACHE_DIRS[kind]) / f"{hash}{self._LEGACY_CACHE_SUFFIXES[kind]}"
+                if not legacy_file.exists():
+                    return None
+                value = legacy_file.read_bytes()
+                self.content_cache.set(key, value)
+            value = self._remember_cached(key, value)
+
+        # the trees and sentences are mutated by the callers: decode a fresh copy each time
+        return value if kind == "embeddings" else _json_loads(value)
+
+    def _remember_cached(self, key: str, raw: bytes):
+        """Keep *raw* in the in‑memory layer; embeddings are kept decoded and read‑only."""
+        value = raw
+        if key.startswith("embeddings:"):
+            value = np.load(io.BytesIO(raw))
+            value.setflags(write=False)
+        self._content_memory_cache.set(key, value)
+        return value
+
+    def _save_cached(self, kind: str, hash: str, value):
+        if self.content_cache is None:
+            return
+
+        if kind == "embeddings":
+            # half precision is plenty for cosine search and halves the cache size
+            buffer = io.BytesIO()
+            np.save(buffer, np.asarray(value, dtype=np.float16))
+            raw = buffer.getvalue()
+        else:
+            raw = _json_dumps(value).encode()
+        self.content_cache.set(f"{kind}:{hash}", raw)
+        self._remember_cached(f"{kind}:{hash}", raw)
 
     def get_embeddings_for_sentences(self, doc_hash: str, sentences_set: List[str],
-                                     count: int = 5):
+                                     count: int = 5) -> np.ndarray:
+        """Return the embeddings of *sentences_set* as a ``float32`` matrix, cached or not."""
         _, res = self.get_cached_content_embeddings(doc_hash=doc_hash)
         if res is not None:
-            return res
-
-        encoding = tiktoken.encoding_for_model(self.embedding_service.model_name)
-        vectors = []
-        tmp_sentences = []
-        tmp_tokens_count = 0
-        for i in range(len(sentences_set)):
-
-            sentences = sentences_set[i]
-            tokens_count = len(encoding.encode(sentences))
-
-            if tmp_tokens_count + tokens_count > 250000:
-                try:
-                    vectors.extend(self.embedding_service.encode_documents(tmp_sentences))
-                    tmp_sentences.clear()
-                    tmp_sentences.append(sentences)
-                    tmp_tokens_count = tokens_count
-                except Exception as e:
-                    if 'maximum context length is 8192' in str(e):
-                        # Find a way to split the text into smaller chunks and encode them separately
-                        pass
-                    raise e
-            else:
-                tmp_sentences.append(sentences)
-                tmp_tokens_count += tokens_count
-
-        if tmp_sentences:
-            try:
-                vectors.extend(self.embedding_service.encode_documents(tmp_sentences))
-            except Exception as e:
-                if 'maximum context length is 8192' in str(e):
-                    # Find a way to split the text into smaller chunks and encode them separately
-                    pass
-                raise e
+            # shared, read-only and possibly float16: hand out a writable float32 copy
+            return np.array(res, dtype=np.float32)
+
+        # identical windows (repeated boilerplate, quotes...) are embedded once
+        distinct_sentences = list(dict.fromkeys(sentences_set))
+        self.logging_service.info("%d distinct sentences out of %d to embed",
+                                  len(distinct_sentences), len(sentences_set))
+
+        # longer inputs are rejected by the embedding models: embed their beginning only
+        tokens_counts = self._count_tokens(distinct_sentences)
+        texts = list(distinct_sentences)
+        for i, tokens_count in enumerate(tokens_counts):
+            if tokens_count > self.EMBEDDING_MAX_INPUT_TOKENS:
+                texts[i] = self._encoding.decode(self._encoding.encode(texts[i])[:self.EMBEDDING_MAX_INPUT_TOKENS])
+                tokens_counts[i] = self.EMBEDDING_MAX_INPUT_TOKENS
+
+        batches = self._pack_embedding_batches(tokens_counts)
+        encoded_batches = self._run_concurrently(*[(self.embedding_service.encode_documents,
+                                                    [texts[i] for i in batch])
+                                                   for batch in batches])
+        vectors_by_text = {}
+        for batch, encoded_batch in zip(batches, encoded_batches):
+            for i, vector in zip(batch, encoded_batch):
+                vectors_by_text[distinct_sentences[i]] = vector
+        vectors = np.asarray([vectors_by_text[sentences] for sentences in sentences_set], dtype=np.float32)
 
         self.save_in_cache_content_embeddings(doc_hash, vectors)
         return vectors
 
 
-    def enrich_sections(self, sections: list, parents=None, level: int=None) -> list:
-        texts = []
+    def _pack_embedding_batches(self, tokens_counts: List[int]) -> List[List[int]]:
+        """Group the indices of *tokens_counts* into as few embedding requests as possible.
 
+        First‑fit decreasing: the largest inputs are placed first, each in the
+        first batch that stays within :py:attr:`EMBEDDING_BATCH_MAX_TOKENS` and
+        :py:attr:`EMBEDDING_BATCH_MAX_ITEMS`.
+        """
+        batches = []
+        batches_tokens = []
+        for index in sorted(range(len(tokens_counts)), key=tokens_counts.__getitem__, reverse=True):
+            tokens_count = tokens_counts[index]
+            for i, batch in enumerate(batches):
+                if (len(batch) < self.EMBEDDING_BATCH_MAX_ITEMS
+                        and batches_tokens[i] + tokens_count <= self.EMBEDDING_BATCH_MAX_TOKENS):
+                    batch.append(index)
+                    batches_tokens[i] += tokens_count
+                    break
+            else:
+                batches.append([index])
+                batches_tokens.append(tokens_count)
+        return batches
+
+    def enrich_sections(self, sections: list, parents=None, level: int=None) -> list:
         if parents is None:
             parents = []
             level = 1
-        # if level is None:
-        #     level = len(sections)
 
-        for section in sections:
-            header = section['header']
-            content = f"{'#'*level} {header}\n\n{section['content']}"
+        # post-order walk: the content of a section ends with the enriched
+        # contents of its subsections, so it is joined once they are done
+        stack = [(section, parents, level, False) for section in reversed(sections)]
+        while stack:
+            section, parents, level, subsections_done = stack.pop()
+            if subsections_done:
+                section['content'] = "\n\n".join(
+                    [section['content'], *(subsection['content'] for subsection in section['subsections'])]
+                )
+                continue
+
+            header_prefix = _HEADER_PREFIXES[level] if level < len(_HEADER_PREFIXES) else f"{'#' * level} "
+            section['content'] = "".join((header_prefix, section['header'], "\n\n", section['content']))
+            section['parents'] = parents
+            section['level'] = level
 
             subsections = section.get('subsections')
             if subsections:
-                parents_to_pass = parents.copy()
-                parents_to_pass.append(header)
-                section['subsections'] = self.enrich_sections(subsections,
-                                                              parents=parents_to_pass, level=level+1)
-
-                for subsection in section['subsections']:
-                    content += f"\n\n{subsection['content']}"
+                # siblings share their parents list
+                subsections_parents = [*parents, section['header']]
+                stack.append((section, parents, level, True))
+                stack.extend((subsection, subsections_parents, level + 1, False)
+                             for subsection in reversed(subsections))
 
-            section['content'] = content
-            section['parents'] = parents
-            section['level'] = level
-            texts.append(section)
-
-        return texts
+        return sections
 
     def parse_llm_response_to_json_list(self, response: str) -> List[dict]:
-        nester_expr = originalTextFor(lineStart + nestedExpr("[", "]"))
-        results = nester_expr.search_string(response)
-        res_json_str = results.as_list()[0][0]
-        return json.loads(res_json_str)
+        return self._extract_json(response, "[")
 
     def parse_llm_response_to_json_object(self, response: str) -> List[dict]:
-        nester_expr = originalTextFor(lineStart + nestedExpr("{", "}"))
-        results = nester_expr.search_string(response)
-        res_json_str = results.as_list()[0][0]
-        return json.loads(res_json_str)
+        return self._extract_json(response, "{")
 
     def _save_sections_in_sql_db(self, doc_hash: str, sections: List[dict]):
-        for i, section in enumerate(sections):
-            sql_doc_id = self.sql_db_service.add_header_content_in_sdb(
-                self.work_title, doc_hash, section['header'], section['content']
-            )
-            sections[i]['sql_doc_id'] = sql_doc_id
-
-            if 'subsections' in section and section['subsections']:
-                self._save_sections_in_sql_db(doc_hash, sections[i]['subsections'])
+        # pre-order, the order in which the sections used to be inserted one by one
+        flat_sections = []
+        stack = list(reversed(sections))
+        while stack:
+            section = stack.pop()
+            flat_sections.append(section)
+            stack.extend(reversed(section.get('subsections') or []))
+
+        headers_contents = [(section['header'], section['content']) for section in flat_sections]
+        # services matching the protocol without subclassing it lack its default bulk method
+        add_header_contents = getattr(self.sql_db_service, "add_header_contents_in_sdb", None)
+        if add_header_contents is not None:
+            sql_doc_ids = add_header_contents(self.work_title, doc_hash, headers_contents)
+        else:
+            sql_doc_ids = [self.sql_db_service.add_header_content_in_sdb(self.work_title, doc_hash, header, content)
+                           for header, content in headers_contents]
+        for section, sql_doc_id in zip(flat_sections, sql_doc_ids):
+            section['sql_doc_id'] = sql_doc_id
 
     def _linearize_sections(self, sections: List[dict]) -> List[dict]:
         res = []
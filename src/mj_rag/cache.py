@@ -0,0 +1,176 @@
+"""Persistent caches used by :class:`mj_rag.algorithm.MJRagAlgorithm`.
+
+* :class:`LRUCache` – a bounded, thread‑safe in‑memory mapping.
+* :class:`SqliteCache` – a minimal thread‑safe key/value store kept in a
+  single SQLite table.
+* :class:`EmbeddingsCache` – stores one embedding vector per text, keyed by
+  the embedding model and a digest of the text.
+* :class:`CachedEmbeddingService` – wraps any
+  :class:`~mj_rag.interfaces.EmbeddingServiceInterface` so that only the
+  texts missing from the cache are sent to the underlying service.
+"""
+import sqlite3
+import threading
+from collections import OrderedDict
+from hashlib import blake2b
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterable, List, Literal, Optional, Union
+
+import numpy as np
+
+from mj_rag.interfaces import EmbeddingServiceInterface
+
+
+class LRUCache:
+    """In‑memory mapping that evicts the least recently used entry beyond *maxsize*.
+
+    ``hits`` and ``misses`` count the lookups made through :py:meth:`get`.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SqliteCache:
+    """Key/value store (``str`` → ``bytes``) backed by one SQLite table."""
+
+    # SQLite limits the number of host parameters in a single statement
+    MAX_VARIABLES = 500
+
+    def __init__(self, path: Union[str, Path], table: str = "cache"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} "
+                               f"(key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.mget([key])[0]
+
+    def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            for i in range(0, len(keys), self.MAX_VARIABLES):
+                chunk = keys[i:i + self.MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})", chunk
+                )
+                found.update(rows)
+        return [found.get(key) for key in keys]
+
+    def set(self, key: str, value: bytes):
+        self.mset({key: value})
+
+    def mset(self, items: Dict[str, bytes]):
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)", items.items()
+            )
+            self._conn.commit()
+
+    def close(self):
+        """Close the SQLite connection; the cache can't be used afterwards."""
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "SqliteCache":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EmbeddingsCache(SqliteCache):
+    """Persist embedding vectors (as flat ``float32`` arrays) keyed by model and text."""
+
+    def __init__(self, path: Union[str, Path] = "embeddings_cache.sqlite3", table: str = "embeddings"):
+        super().__init__(path, table=table)
+
+    @staticmethod
+    def make_key(model_name: str, kind: str, text: str) -> str:
+        return f"{model_name}:{kind}:{blake2b(text.encode()).hexdigest()}"
+
+    def mget_vectors(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        # copied: ``frombuffer`` arrays are read-only views on the fetched bytes
+        return [np.frombuffer(value, dtype=np.float32).copy() if value is not None else None
+                for value in self.mget(keys)]
+
+    def mset_vectors(self, items: Dict[str, Iterable[float]]):
+        self.mset({key: np.asarray(vector, dtype=np.float32).tobytes() for key, vector in items.items()})
+
+
+class CachedEmbeddingService(EmbeddingServiceInterface):
+    """Embedding service decorator that looks texts up in an :class:`EmbeddingsCache` first."""
+
+    def __init__(self, embedding_service: EmbeddingServiceInterface, cache: EmbeddingsCache):
+        self.embedding_service = embedding_service
+        self.cache = cache
+
+    @property
+    def dimensions(self) -> int:
+        return self.embedding_service.dimensions
+
+    @property
+    def model_name(self) -> str:
+        return self.embedding_service.model_name
+
+    def encode_documents(self, documents: List[str]) -> List[np.ndarray]:
+        return self._encode(documents, "document")
+
+    def encode_queries(self, queries: List[str]) -> List[np.ndarray]:
+        return self._encode(queries, "query")
+
+    def _encode(self, texts: List[str], kind: Literal["document", "query"]) -> List[np.ndarray]:
+        keys = [self.cache.make_key(self.model_name, kind, text) for text in texts]
+        vectors = self.cache.mget_vectors(keys)
+
+        # each distinct missing text is encoded only once
+        missing = {keys[i]: texts[i] for i, vector in enumerate(vectors) if vector is None}
+        if missing:
+            encode = (self.embedding_service.encode_documents if kind == "document"
+                      else self.embedding_service.encode_queries)
+            # flattened like the vectors read back from the cache
+            new_vectors = {key: np.asarray(vector, dtype=np.float32).reshape(-1)
+                           for key, vector in zip(missing.keys(), encode(list(missing.values())))}
+            self.cache.mset_vectors(new_vectors)
+            vectors = [vector if vector is not None else new_vectors[key].copy()
+                       for key, vector in zip(keys, vectors)]
+
+        return vectors
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Tuple
 
 from mj_rag.interfaces import SqlDBServiceInterface, EmbeddingServiceInterface
 import json
@@ -13,6 +13,10 @@ class JsonSqlDBService(SqlDBServiceInterface):
             self.folder.mkdir()
 
     def add_header_content_in_sdb(self, work_title: str, doc_hash: str, header: str, content: str) -> str:
+        return self.add_header_contents_in_sdb(work_title, doc_hash, [(header, content)])[0]
+
+    def add_header_contents_in_sdb(self, work_title: str, doc_hash: str,
+                                   headers_contents: List[Tuple[str, str]]) -> List[str]:
         json_file = self.folder / f"{doc_hash}.json"
         if json_file.exists():
             with json_file.open() as fp:
@@ -20,17 +24,15 @@ class JsonSqlDBService(SqlDBServiceInterface):
         else:
             data = {}
 
-        keys = sorted([int(key) for key in data.keys()])
-        if keys:
-            last_id = keys[-1]
-        else:
-            last_id = 0
+        last_id = max((int(key) for key in data.keys()), default=0)
 
-        new_id = last_id + 1
-        data[new_id] = {'header': header, 'content': content}
+        ids = []
+        for new_id, (header, content) in enumerate(headers_contents, start=last_id + 1):
+            data[new_id] = {'header': header, 'content': content}
+            ids.append(f"{doc_hash}#{new_id}")
         with json_file.open('w') as fp:
             fp.write(json.dumps(data, indent=2))
-        return f"{doc_hash}#{new_id}"
+        return ids
 
     def get_content_from_id(self, work_title: str, id: str) -> str:
         parts = id.split('#')
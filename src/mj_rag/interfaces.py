@@ -1,6 +1,9 @@
-from typing import List, Protocol, Optional
+from hashlib import sha256
+from typing import List, Protocol, Optional, Tuple, Union
 import re
 
+import numpy as np
+
 
 class EmbeddingServiceInterface(Protocol):
     dimensions: int
@@ -19,13 +22,28 @@ class SqlDBServiceInterface(Protocol):
                     header: str, content: str) -> str:
         raise NotImplementedError
 
+    def add_header_contents_in_sdb(self, work_title: str, doc_hash: str,
+                                   headers_contents: List[Tuple[str, str]]) -> List[str]:
+        """Store several ``(header, content)`` of a document and return their ids, in order.
+
+        Calls :py:meth:`add_header_content_in_sdb` for each one; backends able to
+        insert in bulk should override it.
+        """
+        return [self.add_header_content_in_sdb(work_title, doc_hash, header, content)
+                for header, content in headers_contents]
+
     def get_content_from_id(self, work_title: str, id: str) -> str:
         raise NotImplementedError
 
 
 class VectorDBServiceInterface(Protocol):
+    """Storage and similarity search of the sentence sets and section headers.
+
+    Implementations are called many times per question, possibly from
+    several threads: they should open their connection/client once and reuse
+    it across calls instead of reconnecting in every method.
+    """
     rgx_space = re.compile(r"\s+")
-    rgx_2_lines = re.compile(r"\n{2,}")
     embedding_service: EmbeddingServiceInterface
 
     def get_collection_name_for_sentences_set(self, work_title: str):
@@ -45,6 +63,12 @@ class VectorDBServiceInterface(Protocol):
     def get_possible_answers_from_question(self, work_title: str, question: str,
                alternates: List[str]=None, hypothetical_answers: List[str]=None,
                             top_k:int = 10, min_score: float = 0.4) -> List[dict]:
+        """Return the sentence sets similar to *question* (or its alternates/hypothetical answers).
+
+        Each hit is a dict with the keys ``score`` (the similarity, higher is
+        better) and ``text`` (the sentence set), plus the optional
+        ``source_title``, ``source_author``, ``source_url`` and ``source_type``.
+        """
         raise NotImplementedError
 
     def get_possible_matchs_from_header(self, work_title: str, sql_db_service: SqlDBServiceInterface,
@@ -54,7 +78,7 @@ class VectorDBServiceInterface(Protocol):
         raise NotImplementedError
 
     def insert_sentences_set(self, work_title:str, sentences_set: List[str],
-                             sentences_vectors: List[List[List[float]]],
+                             sentences_vectors: Union[np.ndarray, List[List[List[float]]]],
                              source_title: str,
                              source_author: Optional[str] = None,
                              source_url: Optional[str] = None,
@@ -80,30 +104,57 @@ class VectorDBServiceInterface(Protocol):
         """
         raise NotImplementedError
 
+    @staticmethod
+    def normalize_vectors(vectors) -> np.ndarray:
+        """Return *vectors* as one contiguous ``float32`` matrix of unit‑length rows.
+
+        Stored and query vectors must both go through it for the inner‑product
+        metric to be the cosine similarity, whatever the embedding model.  The
+        vectors handed to :py:meth:`insert_sentences_set` are raw embeddings:
+        implementations normalise every vector themselves, stored or queried.
+        """
+        vectors = np.array(vectors, dtype=np.float32, order="C")
+        if vectors.size:
+            vectors /= np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12
+        return vectors
+
     def get_content_hash(self, content: str) -> str:
-        from hashlib import sha256
+        # every whitespace, newlines included, is dropped before hashing
         content = self.rgx_space.sub('', content)
-        content = self.rgx_2_lines.sub('\n', content)
-
-        m = sha256(content.encode())
-        return m.hexdigest()
+        return sha256(content.encode()).hexdigest()
 
 
 class LoggingServiceInterface(Protocol):
+    """Logger; :class:`logging.Logger` satisfies it."""
+
+    def isEnabledFor(self, level: int) -> bool:
+        """Whether a record of *level* would be handled; lets callers skip costly messages.
 
-    def debug(self, message: str, **kwargs):
+        Optional: :class:`~mj_rag.algorithm.MJRagAlgorithm` treats services
+        without it as enabled for every level.
+        """
+        return True
+
+    def debug(self, message: str, *args, **kwargs):
         raise NotImplementedError
 
-    def info(self, message: str, **kwargs):
+    def info(self, message: str, *args, **kwargs):
         raise NotImplementedError
 
-    def warning(self, message: str, **kwargs):
+    def warning(self, message: str, *args, **kwargs):
         raise NotImplementedError
 
-    def error(self, message: str, **kwargs):
+    def error(self, message: str, *args, **kwargs):
         raise NotImplementedError
 
 
 class LLMServiceInterface(Protocol):
+    """Chat completion backend.
+
+    A single question can trigger several completions, some of them
+    concurrently: implementations should keep a persistent, pooled HTTP
+    client (keep-alive, ideally HTTP/2) instead of opening a connection per
+    request.
+    """
     def complete_messages(self, messages: List[dict], **kwargs) -> str:
         raise NotImplementedError
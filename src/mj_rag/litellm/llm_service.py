@@ -1,3 +1,4 @@
+import threading
 from itertools import cycle
 from typing import List, Union
 from litellm import completion, RateLimitError
@@ -7,21 +8,26 @@ from mj_rag.interfaces import LLMServiceInterface
 
 
 class RotatingList:
+    """Cycle through *initial*; safe to share between threads."""
+
     def __init__(self, initial: list):
         self._initial: list = initial
         self._current = None
         self._cycle = cycle(self._initial)
+        self._lock = threading.Lock()
 
     @property
     def current(self):
-        if self._current:
-            return self._current
+        with self._lock:
+            if self._current:
+                return self._current
 
-        self._current = next(self._cycle)
-        return self._current
+            self._current = next(self._cycle)
+            return self._current
 
     def next(self):
-        self._current = next(self._cycle)
+        with self._lock:
+            self._current = next(self._cycle)
 
     @property
     def max_iter(self) -> int:
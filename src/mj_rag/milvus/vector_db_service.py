@@ -1,5 +1,7 @@
-import re
-from typing import List, Optional
+import threading
+from typing import Dict, List, Optional, Union
+
+import numpy as np
 
 from mj_rag.interfaces import VectorDBServiceInterface, EmbeddingServiceInterface, SqlDBServiceInterface
 from pymilvus import (
@@ -23,103 +25,131 @@ class MilvusVectorDBService(VectorDBServiceInterface):
     SQL_CONTENT_ID_FIELD = "content_id"
     PARENTS_SEPARATOR = " -> "
 
-    rgx_2_lines = re.compile(r"\n{2,}")
+    # the section headers are few: an exact index costs little.  The sentence
+    # sets use IVF_SQ8, whose 8-bit codes take ~4x less memory than IVF_FLAT
+    SECTION_HEADERS_INDEX = {"index_type": "FLAT", "metric_type": "IP"}
+    SENTENCES_SET_INDEX = {"index_type": "IVF_SQ8", "metric_type": "IP", "params": {"nlist": 128}}
+    # lists probed per IVF search (Milvus' default of 8 of the 128 loses recall); ignored by FLAT
+    SEARCH_PARAMS = {"nprobe": 32}
 
     def __init__(self, uri: str, embedding_service: EmbeddingServiceInterface, **kwargs):
         self.uri: str = uri
         self.embedding_service = embedding_service
+        self._connected: bool = False
+        self._collections: Dict[str, Collection] = {}
+        # the ingestion of the sentence sets and of the section headers run in
+        # parallel: connecting and creating collections must happen only once
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        """Open the Milvus connection once and reuse it for every call."""
+        with self._lock:
+            if not self._connected:
+                milvus_connections.connect(uri=self.uri)
+                self._connected = True
+
+    def _get_collection(self, collection_name: str) -> Collection:
+        """Return the (cached) handle of an existing collection."""
+        collection = self._collections.get(collection_name)
+        if collection is None:
+            with self._lock:
+                collection = self._collections.get(collection_name)
+                if collection is None:
+                    self._connect()
+                    collection = Collection(collection_name)
+                    self._collections[collection_name] = collection
+        return collection
 
     def create_collection_for_section_headers(self, work_title: str):
-        milvus_connections.connect(uri=self.uri)
-
-        collection_name = self.get_collection_name_for_section_headers(work_title)
-        if not utility.has_collection(collection_name):
-
-            fields = [
-                FieldSchema(
-                    name=self.ID_FIELD,
-                    dtype=DataType.VARCHAR,
-                    is_primary=True,
-                    auto_id=True,
-                    max_length=100,
-                ),
-                FieldSchema(name=self.DENSE_VECTOR_FIELD, dtype=DataType.FLOAT_VECTOR, dim=self.embedding_service.dimensions),
-                FieldSchema(name=self.TEXT_FIELD, dtype=DataType.VARCHAR, max_length=4_096),
-                FieldSchema(name=self.SQL_CONTENT_ID_FIELD, dtype=DataType.VARCHAR, max_length=128),
-                FieldSchema(name="level", dtype=DataType.INT8),
-                FieldSchema(name="parents", dtype=DataType.VARCHAR, max_length=12_288),
-                FieldSchema(name="source_title", dtype=DataType.VARCHAR, max_length=12_288),
-                FieldSchema(name="source_author", dtype=DataType.VARCHAR, max_length=12_288),
-                FieldSchema(name="source_url", dtype=DataType.VARCHAR, max_length=12_288),
-                FieldSchema(name="source_type", dtype=DataType.VARCHAR, max_length=12_288),
-                # FieldSchema(name=sparse_field, dtype=DataType.SPARSE_FLOAT_VECTOR),
-                # FieldSchema(name=sparse_field, dtype=DataType.SPARSE_FLOAT_VECTOR),
-            ]
-
-            schema = CollectionSchema(fields=fields, enable_dynamic_field=True)
-            collection = Collection(
-                name=collection_name, schema=schema, consistency_level="Strong"
-            )
-
-            dense_index = {"index_type": "FLAT", "metric_type": "IP"}
-            collection.create_index("vector", dense_index)
-            # sparse_index = {"index_type": "SPARSE_INVERTED_INDEX", "metric_type": "IP"}
-            # collection.create_index("sparse_vector", sparse_index)
-            collection.flush()
-        else:
-            collection = Collection(collection_name)
+        with self._lock:
+            self._connect()
+
+            collection_name = self.get_collection_name_for_section_headers(work_title)
+            if not utility.has_collection(collection_name):
+
+                fields = [
+                    FieldSchema(
+                        name=self.ID_FIELD,
+                        dtype=DataType.VARCHAR,
+                        is_primary=True,
+                        auto_id=True,
+                        max_length=100,
+                    ),
+                    FieldSchema(name=self.DENSE_VECTOR_FIELD, dtype=DataType.FLOAT_VECTOR, dim=self.embedding_service.dimensions),
+                    FieldSchema(name=self.TEXT_FIELD, dtype=DataType.VARCHAR, max_length=4_096),
+                    FieldSchema(name=self.SQL_CONTENT_ID_FIELD, dtype=DataType.VARCHAR, max_length=128),
+                    FieldSchema(name="level", dtype=DataType.INT8),
+                    FieldSchema(name="parents", dtype=DataType.VARCHAR, max_length=12_288),
+                    FieldSchema(name="source_title", dtype=DataType.VARCHAR, max_length=12_288),
+                    FieldSchema(name="source_author", dtype=DataType.VARCHAR, max_length=12_288),
+                    FieldSchema(name="source_url", dtype=DataType.VARCHAR, max_length=12_288),
+                    FieldSchema(name="source_type", dtype=DataType.VARCHAR, max_length=12_288),
+                    # FieldSchema(name=sparse_field, dtype=DataType.SPARSE_FLOAT_VECTOR),
+                    # FieldSchema(name=sparse_field, dtype=DataType.SPARSE_FLOAT_VECTOR),
+                ]
+
+                schema = CollectionSchema(fields=fields, enable_dynamic_field=True)
+                collection = Collection(
+                    name=collection_name, schema=schema, consistency_level="Strong"
+                )
+
+                collection.create_index("vector", self.SECTION_HEADERS_INDEX)
+                # sparse_index = {"index_type": "SPARSE_INVERTED_INDEX", "metric_type": "IP"}
+                # collection.create_index("sparse_vector", sparse_index)
+                collection.flush()
+                self._collections[collection_name] = collection
+            else:
+                self._get_collection(collection_name)
 
     def create_collection_for_sentences_set(self, work_title: str):
-        milvus_connections.connect(uri=self.uri)
-
-        collection_name = self.get_collection_name_for_sentences_set(work_title)
-        if not utility.has_collection(collection_name):
-
-            fields = [
-                FieldSchema(
-                    name=self.ID_FIELD,
-                    dtype=DataType.VARCHAR,
-                    is_primary=True,
-                    auto_id=True,
-                    max_length=100,
-                ),
-                FieldSchema(name=self.DENSE_VECTOR_FIELD, dtype=DataType.FLOAT_VECTOR, dim=self.embedding_service.dimensions),
-                FieldSchema(name=self.TEXT_FIELD, dtype=DataType.VARCHAR, max_length=65_535),
-                FieldSchema(name="source_title", dtype=DataType.VARCHAR, max_length=12_288),
-                FieldSchema(name="source_author", dtype=DataType.VARCHAR, max_length=12_288),
-                FieldSchema(name="source_url", dtype=DataType.VARCHAR, max_length=12_288),
-                FieldSchema(name="source_type", dtype=DataType.VARCHAR, max_length=12_288),
-                # FieldSchema(name=sparse_field, dtype=DataType.SPARSE_FLOAT_VECTOR),
-            ]
-
-            schema = CollectionSchema(fields=fields, enable_dynamic_field=True)
-            collection = Collection(
-                name=collection_name, schema=schema, consistency_level="Strong"
-            )
-
-            dense_index = {"index_type": "IVF_FLAT", "metric_type": "IP"}
-            collection.create_index("vector", dense_index)
-            collection.flush()
-        else:
-            collection = Collection(collection_name)
+        with self._lock:
+            self._connect()
+
+            collection_name = self.get_collection_name_for_sentences_set(work_title)
+            if not utility.has_collection(collection_name):
+
+                fields = [
+                    FieldSchema(
+                        name=self.ID_FIELD,
+                        dtype=DataType.VARCHAR,
+                        is_primary=True,
+                        auto_id=True,
+                        max_length=100,
+                    ),
+                    FieldSchema(name=self.DENSE_VECTOR_FIELD, dtype=DataType.FLOAT_VECTOR, dim=self.embedding_service.dimensions),
+                    FieldSchema(name=self.TEXT_FIELD, dtype=DataType.VARCHAR, max_length=65_535),
+                    FieldSchema(name="source_title", dtype=DataType.VARCHAR, max_length=12_288),
+                    FieldSchema(name="source_author", dtype=DataType.VARCHAR, max_length=12_288),
+                    FieldSchema(name="source_url", dtype=DataType.VARCHAR, max_length=12_288),
+                    FieldSchema(name="source_type", dtype=DataType.VARCHAR, max_length=12_288),
+                    # FieldSchema(name=sparse_field, dtype=DataType.SPARSE_FLOAT_VECTOR),
+                ]
+
+                schema = CollectionSchema(fields=fields, enable_dynamic_field=True)
+                collection = Collection(
+                    name=collection_name, schema=schema, consistency_level="Strong"
+                )
+
+                collection.create_index("vector", self.SENTENCES_SET_INDEX)
+                collection.flush()
+                self._collections[collection_name] = collection
+            else:
+                self._get_collection(collection_name)
 
     def get_possible_answers_from_question(self, work_title: str, question: str,
                alternates: List[str] = None, hypothetical_answers: List[str] = None,
                 top_k: int = 10, min_score: float = 0.4) -> List[dict]:
-        milvus_connections.connect(uri=self.uri)
-
-        collection_name = self.get_collection_name_for_sentences_set(work_title)
-        collection = Collection(collection_name)
+        collection = self._get_collection(self.get_collection_name_for_sentences_set(work_title))
 
         queries = [question]
         if alternates:
             queries.extend(alternates)
         if hypothetical_answers:
             queries.extend(hypothetical_answers)
-        query_vectors = self.embedding_service.encode_queries(queries)
+        query_vectors = list(self.normalize_vectors(self.embedding_service.encode_queries(queries)))
 
         res = collection.search(query_vectors, self.DENSE_VECTOR_FIELD,
-                                {"metric_type": "IP", "params": {"radius": min_score}},
+                                {"metric_type": "IP", "params": {**self.SEARCH_PARAMS, "radius": min_score}},
                                 top_k, output_fields=[self.TEXT_FIELD, 'source_title',
                                                       'source_author', 'source_url',
                                                       'source_type'])
@@ -143,15 +173,12 @@ class MilvusVectorDBService(VectorDBServiceInterface):
                                         header: str,
                                         alternates: List[str] = None,
                                         top_k:int = 10, min_score: float = 0.4) -> List[dict]:
-        milvus_connections.connect(uri=self.uri)
-
-        collection_name = self.get_collection_name_for_section_headers(work_title)
-        collection = Collection(collection_name)
+        collection = self._get_collection(self.get_collection_name_for_section_headers(work_title))
 
-        query_vectors = self.embedding_service.encode_queries([header])
+        query_vectors = list(self.normalize_vectors(self.embedding_service.encode_queries([header])))
 
         res = collection.search(query_vectors, self.DENSE_VECTOR_FIELD,
-                                {"metric_type": "IP", "params": {"radius": min_score}},
+                                {"metric_type": "IP", "params": {**self.SEARCH_PARAMS, "radius": min_score}},
                                 top_k, output_fields=[self.TEXT_FIELD, "parents", "level",
                                                       self.SQL_CONTENT_ID_FIELD, 'source_title',
                                                       'source_author', 'source_url',
@@ -185,10 +212,10 @@ class MilvusVectorDBService(VectorDBServiceInterface):
                 })
 
         if alternates and len(answers) < top_k:
-            query_vectors = self.embedding_service.encode_queries(alternates)
+            query_vectors = list(self.normalize_vectors(self.embedding_service.encode_queries(alternates)))
 
             res = collection.search(query_vectors, self.DENSE_VECTOR_FIELD,
-                                    {"metric_type": "IP", "params": {"radius": min_score}},
+                                    {"metric_type": "IP", "params": {**self.SEARCH_PARAMS, "radius": min_score}},
                                     top_k - len(answers),  # we need to fill only top_k answers
                                     output_fields=[self.TEXT_FIELD, "parents", "level",
                                                    self.SQL_CONTENT_ID_FIELD, 'source_title',
@@ -224,17 +251,15 @@ class MilvusVectorDBService(VectorDBServiceInterface):
         return answers
 
     def insert_sentences_set(self, work_title: str, sentences_set: List[str],
-                             sentences_vectors: List[List[List[float]]],
+                             sentences_vectors: Union[np.ndarray, List[List[List[float]]]],
                              source_title: str,
                              source_author: Optional[str] = None,
                              source_url: Optional[str] = None,
                              source_type: Optional[str] = None,
                              ):
-        milvus_connections.connect(uri=self.uri)
-
-        collection_name = self.get_collection_name_for_sentences_set(work_title)
-        collection = Collection(collection_name)
+        collection = self._get_collection(self.get_collection_name_for_sentences_set(work_title))
 
+        sentences_vectors = self.normalize_vectors(sentences_vectors)
         data = [
             {
                 self.DENSE_VECTOR_FIELD: sentences_vectors[i],
@@ -256,12 +281,11 @@ class MilvusVectorDBService(VectorDBServiceInterface):
                                source_url: Optional[str] = None,
                                source_type: Optional[str] = None,
                                **kwargs):
-        milvus_connections.connect(uri=self.uri)
-
-        collection_name = self.get_collection_name_for_section_headers(work_title)
-        collection = Collection(collection_name)
+        collection = self._get_collection(self.get_collection_name_for_section_headers(work_title))
 
-        vectors = self.embedding_service.encode_documents([section['header'] for section in sections])
+        vectors = self.normalize_vectors(
+            self.embedding_service.encode_documents([section['header'] for section in sections])
+        )
         data = [
             {
                 self.DENSE_VECTOR_FIELD: vectors[i],
@@ -279,4 +303,3 @@ class MilvusVectorDBService(VectorDBServiceInterface):
         collection.insert(data)
 
         data.clear()
-        vectors.clear()
@@ -1,14 +1,18 @@
+from collections import Counter, defaultdict
 from math import ceil, floor
 
 import pymupdf
-from typing import Union, Optional
+from typing import DefaultDict, Optional, Set, Tuple, Union
 import pymupdf4llm
 import re
-import string
+
+
+# rounded (x0, y0, x1, y1) of a text block, identifying it across pages
+BlockSignature = Tuple[int, int, int, int]
 
 
 class MjPdfReader:
-    rgx_space = re.compile(r" +")
+    rgx_escaped_space = re.compile(r"(?:\\ )+")
 
     def __init__(self, file_path: Optional[str] = None,
                  file_content: Optional[Union[str, bytes]] = None):
@@ -21,56 +25,54 @@ class MjPdfReader:
         else:
             raise ValueError("Either file_path or file_content must be provided.")
 
+        # each pass over the document is done at most once per reader
+        self._markdown: Optional[str] = None
+        self._blocks_by_signature: Optional[Tuple[Counter, DefaultDict[BlockSignature, Set[str]]]] = None
+
     def get_markdown(self):
+        if self._markdown is not None:
+            return self._markdown
+
         md_text = pymupdf4llm.to_markdown(self.doc)
         recurrent_texts = self.get_list_of_recurrent_texts_as_dict()
 
-        trans_table_d = {}
-        for c in ".^$*+-?()[]{}\|":
-            trans_table_d[c] = f"\\{c}"
+        patterns = {self.rgx_escaped_space.sub(" +", re.escape(repeated))
+                    for value in recurrent_texts.values()
+                    for repeated in value['texts'] if repeated}
+        if patterns:
+            # one pass removing every line containing any recurrent text
+            alternation = "|".join(sorted(patterns, key=len, reverse=True))
+            md_text = re.sub(f"[^\n]*(?:{alternation})[^\n]*", "", md_text)
 
-        trans_table = str.maketrans(trans_table_d)
-
-        for signature, value in recurrent_texts.items():
-            repeated_set = value['texts']
-            for repeated in repeated_set:
-                translated = repeated.translate(trans_table)
-                repeated_for_rgx = self.rgx_space.sub(" +", translated)
-
-                md_text = re.sub(f"[^\n]*{repeated_for_rgx}[^\n]*", "", md_text)
-
-        md_text = re.sub(r"\n{4,}", "\n\n", md_text)
-        return md_text
+        self._markdown = re.sub(r"\n{4,}", "\n\n", md_text)
+        return self._markdown
 
     def get_list_of_recurrent_texts_as_list(self):
-        recurrents = {}
-        for page in self.doc:
-            text_page = page.get_textpage()
-
-            for block in text_page.extractBLOCKS():
-                signature = self.get_block_signature(block)
-                recurrents.setdefault(signature, 0)
-                recurrents[signature] = recurrents[signature] + 1
+        counts, _ = self._count_blocks_by_signature()
         ratio = int(self.doc.page_count * 0.5)
-        return [text for text, value in recurrents.items() if value >= ratio]
+        return [signature for signature, count in counts.items() if count >= ratio]
 
     def get_list_of_recurrent_texts_as_dict(self):
-        recurrents = {}
-        for page in self.doc:
-            text_page = page.get_textpage()
-
-            for block in text_page.extractBLOCKS():
-                signature = self.get_block_signature(block)
-                recurrents.setdefault(signature, {'count': 0, 'texts': set()})
-                recurrents[signature]['count'] = recurrents[signature]['count'] + 1
-                recurrents[signature]['texts'].add(block[4].strip())
+        counts, texts = self._count_blocks_by_signature()
         ratio = int(self.doc.page_count * 0.5)
+        # copied: the memoized sets must not change with the caller's edits
+        return {signature: {'count': count, 'texts': set(texts[signature])}
+                for signature, count in counts.items() if count >= ratio}
+
+    def _count_blocks_by_signature(self) -> Tuple[Counter, DefaultDict[BlockSignature, Set[str]]]:
+        """Count the text blocks of every page by signature, and collect their texts."""
+        if self._blocks_by_signature is not None:
+            return self._blocks_by_signature
 
-        return {text: value for text, value in recurrents.items() if value['count'] >= ratio}
+        counts = Counter()
+        texts = defaultdict(set)
+        for page in self.doc:
+            for block in page.get_textpage().extractBLOCKS():
+                signature = self.get_block_signature(block)
+                counts[signature] += 1
+                texts[signature].add(block[4].strip())
+        self._blocks_by_signature = counts, texts
+        return self._blocks_by_signature
 
-    def get_block_signature(self, block: tuple):
-        x = ceil(block[0])
-        y = floor(block[1])
-        w = round(block[2])
-        h = round(block[3])
-        return f"{x}-{y}-{w}-{h}"
+    def get_block_signature(self, block: tuple) -> BlockSignature:
+        return ceil(block[0]), floor(block[1]), round(block[2]), round(block[3])
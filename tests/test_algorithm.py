@@ -349,3 +349,299 @@ class MJRagAlgorithmTestCase(TestCase):
                                                   [OPENAI_API_KEY]))
         sections = algorithm.save_text_as_titles_in_vdb(pdf_content_1)
         print(json.dumps(sections, indent=2))
+
+    def test_21_extract_to_json_object(self):
+        algorithm = MJRagAlgorithm("test", DummyVectorDBService(), DummyLLMService(),
+                                   embeddings_cache_path=None, content_cache_path=None)
+        response = ('Here is my answer: {"not": "this one"}\n'
+                    '```json\n'
+                    '{"reasoning": "braces } and \\"quotes {\\" in a string",\n'
+                    ' "number_of_sentences": "FEW", "extra": {"kind": "SUMMARY"}}\n'
+                    '```')
+        self.assertEqual(algorithm._extract_to_json_object(response), {
+            "reasoning": 'braces } and "quotes {" in a string',
+            "number_of_sentences": "FEW",
+            "extra": {"kind": "SUMMARY"},
+        })
+
+    def test_22_section_modes_dispatch(self):
+        algorithm = MJRagAlgorithm("test", DummyVectorDBService(), DummyLLMService(),
+                                   embeddings_cache_path=None, content_cache_path=None)
+        self.assertEqual(algorithm._MODE_TO_KIND.get(SectionAnswerMode.TOP_K_COMBINE), "COMBINE")
+        self.assertEqual(algorithm._MODE_TO_KIND.get(SectionAnswerMode.TOP_K_SUMMARY), "SUMMARY")
+        self.assertIsNone(algorithm._MODE_TO_KIND.get(SectionAnswerMode.TOP_K_RAW))
+        for mode in SectionAnswerMode:
+            self.assertTrue(callable(getattr(algorithm, algorithm._SECTION_MODE_HANDLERS[mode])))
+
+        matchs = [{'header': "Intro", 'parents': [], 'level': 1, 'score': 0.9,
+                   'source_title': "Doc", 'content': "Hello", 'sql_doc_id': "x#1"}]
+        self.assertEqual(algorithm._process_section_matchs(matchs, SectionAnswerMode.TOP_K_COMBINE),
+                         "Dummy response")
+
+    def test_23_dedupe_queries(self):
+        algorithm = MJRagAlgorithm("test", DummyVectorDBService(), DummyLLMService(),
+                                   embeddings_cache_path=None, content_cache_path=None)
+        seen = {algorithm._canonical_text("How old is Jeff?")}
+        alternates = algorithm._dedupe_queries(["how old  is jeff?", "What is Jeff's age?",
+                                                "What is  jeff's age?"], seen)
+        self.assertEqual(alternates, ["What is Jeff's age?"])
+        self.assertEqual(algorithm._dedupe_queries(["Jeff is 18", "what is jeff's age?"], seen),
+                         ["Jeff is 18"])
+
+    def test_24_content_cache(self):
+        import tempfile
+        import numpy as np
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            algorithm = MJRagAlgorithm("test", DummyVectorDBService(), DummyLLMService(),
+                                       embeddings_cache_path=None,
+                                       content_cache_path=os.path.join(tmp_dir, "content.sqlite3"))
+            hash, res = algorithm.get_cached_content_sentences("Jeff is 18. He lives in Douala.")
+            self.assertIsNone(res)
+            algorithm.save_in_cache_content_sentences(hash, ["Jeff is 18.", "He lives in Douala."])
+            algorithm.save_in_cache_content_embeddings(hash, np.eye(2, dtype=np.float32))
+            self.assertEqual(algorithm.get_cached_content_sentences("", doc_hash=hash)[1],
+                             ["Jeff is 18.", "He lives in Douala."])
+            embeddings = algorithm.get_cached_content_embeddings(doc_hash=hash)[1]
+            self.assertEqual(embeddings.dtype, np.float16)
+            np.testing.assert_array_equal(embeddings, np.eye(2, dtype=np.float32))
+            self.assertIsNone(algorithm.get_cached_content_json_tree("", doc_hash=hash)[1])
+            algorithm.close()
+
+    def test_25_pack_embedding_batches(self):
+        algorithm = MJRagAlgorithm("test", DummyVectorDBService(), DummyLLMService(),
+                                   embeddings_cache_path=None, content_cache_path=None)
+        algorithm.EMBEDDING_BATCH_MAX_TOKENS = 10
+        algorithm.EMBEDDING_BATCH_MAX_ITEMS = 3
+        batches = algorithm._pack_embedding_batches([2, 7, 3, 5, 1, 1, 1])
+        self.assertEqual(batches, [[1, 2], [3, 0, 4], [5, 6]])
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(7)))
+
+    def test_26_sentence_windows(self):
+        algorithm = MJRagAlgorithm("test", DummyVectorDBService(), DummyLLMService(),
+                                   embeddings_cache_path=None, content_cache_path=None)
+        lines = algorithm._split_sentences("Jeff is 18.  He lives in Douala!\n\nHe likes football? Yes")
+        self.assertEqual(lines, ["Jeff is 18", ".", "He lives in Douala", "!", "He likes football", "?", "Yes"])
+        self.assertEqual(algorithm._make_windows(lines, 2), [" Jeff is 18 . He lives in Douala !",
+                                                             " He lives in Douala ! He likes football ?"])
+
+    def test_27_legacy_logging_service(self):
+        messages = []
+
+        class LegacyLoggingService:
+            def debug(self, message, **kwargs):
+                messages.append(message)
+            info = warning = error = debug
+
+        algorithm = MJRagAlgorithm("test", DummyVectorDBService(), DummyLLMService(),
+                                   logging_service=LegacyLoggingService(),
+                                   embeddings_cache_path=None, content_cache_path=None)
+        algorithm.logging_service.debug("hash = %r", "abc")
+        algorithm.logging_service.info("100% done")
+        self.assertEqual(messages, ["hash = 'abc'", "100% done"])
+        self.assertTrue(algorithm.logging_service.isEnabledFor(logging.DEBUG))
+
+    def test_28_cached_embedding_service_shapes(self):
+        import tempfile
+        from mj_rag.cache import EmbeddingsCache, CachedEmbeddingService
+        from mj_rag.dummy import DummyEmbeddingService
+        embedding_service = DummyEmbeddingService()
+        embedding_service.model_name = "dummy"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cached_service = CachedEmbeddingService(embedding_service,
+                                                    EmbeddingsCache(os.path.join(tmp_dir, "e.sqlite3")))
+            missed = cached_service.encode_documents(["Jeff is 18"])[0]
+            hit = cached_service.encode_documents(["Jeff is 18"])[0]
+            self.assertEqual(missed.shape, hit.shape)
+            self.assertTrue(missed.flags.writeable and hit.flags.writeable)
+
+    def test_29_malformed_classification_not_cached(self):
+        class ClassifyingLLMService(LLMServiceInterface):
+            responses = ['{"reasoning": "no verdict"}', '{"number_of_sentences": "FEW"}']
+
+            def complete_messages(self, messages: List[dict], **kwargs) -> str:
+                return self.responses.pop(0)
+
+        algorithm = MJRagAlgorithm("test", DummyVectorDBService(), ClassifyingLLMService(),
+                                   embeddings_cache_path=None, content_cache_path=None)
+        self.assertEqual(algorithm._classify_answer_for_question("How old is Jeff?"), {"reasoning": "no verdict"})
+        self.assertEqual(algorithm._classify_answer_for_question("How old is Jeff?"), {"number_of_sentences": "FEW"})
+        self.assertEqual(algorithm._classify_answer_for_question("How old is Jeff?"), {"number_of_sentences": "FEW"})
+
+    def test_30_save_sections_with_non_subclassing_sql_service(self):
+        class SqlDBService:
+            def __init__(self):
+                self.rows = []
+
+            def add_header_content_in_sdb(self, work_title, doc_hash, header, content):
+                self.rows.append((header, content))
+                return f"{doc_hash}#{len(self.rows)}"
+
+            def get_content_from_id(self, work_title, id):
+                return self.rows[int(id.split('#')[1]) - 1][1]
+
+        sql_db_service = SqlDBService()
+        algorithm = MJRagAlgorithm("test", DummyVectorDBService(), DummyLLMService(),
+                                   sql_db_service=sql_db_service, content_cache_path=None)
+        sections = [{'header': "Intro", 'content': "Hello",
+                     'subsections': [{'header': "Details", 'content': "World"}]},
+                    {'header': "End", 'content': "Bye"}]
+        algorithm._save_sections_in_sql_db("abc", sections)
+        self.assertEqual(sql_db_service.rows, [("Intro", "Hello"), ("Details", "World"), ("End", "Bye")])
+        self.assertEqual([sections[0]['sql_doc_id'], sections[0]['subsections'][0]['sql_doc_id'],
+                          sections[1]['sql_doc_id']], ["abc#1", "abc#2", "abc#3"])
+
+    def test_31_speculative_probe(self):
+        prompts = []
+        contexts = []
+        searches = []
+
+        class RecordingLLMService(LLMServiceInterface):
+            def complete_messages(self, messages: List[dict], **kwargs) -> str:
+                prompts.append(messages[-1]['content'])
+                if len(messages) > 1:
+                    contexts.append(messages[-2]['content'])
+                if "alternative questions" in prompts[-1]:
+                    return "- What is Jeff's age?\n"
+                if "hypothetical answers" in prompts[-1]:
+                    return "- Jeff is 18\n"
+                return "Jeff is 18."
+
+        class RecordingVectorDBService(DummyVectorDBService):
+            score = 0.95
+
+            def get_possible_answers_from_question(self, work_title, question, alternates=None,
+                                                   hypothetical_answers=None, top_k=10, min_score=0.4):
+                searches.append((question, alternates, hypothetical_answers))
+                return [{'score': self.score, 'text': f"Found by {question}", 'source_title': "Bio"}]
+
+        vector_db_service = RecordingVectorDBService()
+        algorithm = MJRagAlgorithm("test", vector_db_service, RecordingLLMService(),
+                                   speculative_min_score=0.9, content_cache_path=None)
+        algorithm.get_direct_answer("How old is Jeff?", use_alternates=True, use_hypothetical_answers=True)
+        # a confident probe skips the LLM helpers
+        self.assertEqual(prompts, ["How old is Jeff?"])
+        self.assertEqual(searches, [("How old is Jeff?", None, None)])
+
+        prompts.clear()
+        searches.clear()
+        vector_db_service.score = 0.5
+        algorithm.get_direct_answer("How old is Jeff?", use_alternates=True, use_hypothetical_answers=True)
+        # on a miss the bare question is not searched again and the probe hits stay in the context
+        self.assertEqual(searches, [("How old is Jeff?", None, None),
+                                    ("What is Jeff's age?", [], ["Jeff is 18"])])
+        self.assertIn("Found by How old is Jeff?", contexts[-1])
+        self.assertIn("Found by What is Jeff's age?", contexts[-1])
+
+    def test_32_format_context_token_budget(self):
+        algorithm = MJRagAlgorithm("test", DummyVectorDBService(), DummyLLMService(),
+                                   content_cache_path=None)
+        found_texts = [
+            {'score': 0.5, 'text': "Jeff lives in Douala.", 'source_title': "Bio"},
+            {'score': 0.9, 'text': "Jeff is 18 years old.", 'source_title': "Bio", 'source_url': "https://bio"},
+            {'score': 0.7, 'text': "Jeff is 18 years old.", 'source_title': "Other"},
+            {'score': 0.6, 'text': "Jeff likes football."},
+        ]
+        entries = ["[#1 src=Bio url=https://bio] Jeff is 18 years old.",
+                   "[#2 src=] Jeff likes football.",
+                   "[#3 src=Bio] Jeff lives in Douala."]
+        self.assertEqual(algorithm._format_context(found_texts, max_tokens=1000), "\n".join(entries))
+
+        tokens_counts = algorithm._count_tokens(entries)
+        self.assertEqual(algorithm._format_context(found_texts, max_tokens=sum(tokens_counts[:2])),
+                         "\n".join(entries[:2]))
+        # the best hit is kept even when it alone exceeds the budget
+        self.assertEqual(algorithm._format_context(found_texts, max_tokens=1), entries[0])
+
+    def test_33_embeddings_same_type_on_cache_hit_and_miss(self):
+        import io
+        import tempfile
+        import numpy as np
+
+        def _npy_bytes(array):
+            buffer = io.BytesIO()
+            np.save(buffer, array)
+            return buffer.getvalue()
+
+        class FixedEmbeddingService(DummyEmbeddingService):
+            def encode_documents(self, documents: List[str]) -> List[List[float]]:
+                return [[float(len(document)), 1.0] for document in documents]
+
+        class FixedVectorDBService(DummyVectorDBService):
+            embedding_service = FixedEmbeddingService()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with MJRagAlgorithm("test", FixedVectorDBService(), DummyLLMService(),
+                                content_cache_path=os.path.join(tmp_dir, "content.sqlite3")) as algorithm:
+                missed = algorithm.get_embeddings_for_sentences("abc", ["Jeff is 18.", "Yes"])
+                hit = algorithm.get_embeddings_for_sentences("abc", ["Jeff is 18.", "Yes"])
+                # entries cached before the float16 storage hold float32 arrays
+                algorithm.content_cache.set("embeddings:def", _npy_bytes(missed))
+                legacy_hit = algorithm.get_embeddings_for_sentences("def", ["Jeff is 18.", "Yes"])
+                legacy_hit_again = algorithm.get_embeddings_for_sentences("def", ["Jeff is 18.", "Yes"])
+        self.assertIsNot(legacy_hit, legacy_hit_again)
+        for vectors in (missed, hit, legacy_hit):
+            self.assertIsInstance(vectors, np.ndarray)
+            self.assertEqual(vectors.dtype, np.float32)
+            self.assertTrue(vectors.flags.writeable)
+            np.testing.assert_array_equal(vectors, missed)
+
+    def test_34_split_content_with_llm_retries(self):
+        class ScriptedLLMService(LLMServiceInterface):
+            def __init__(self, responses):
+                self.responses = list(responses)
+                self.errors_sent = []
+
+            def complete_messages(self, messages: List[dict], **kwargs) -> str:
+                self.errors_sent.append([message['content'] for message in messages[1:]])
+                return self.responses.pop(0)
+
+        empty = "   "
+        truncated = '[{"header": "Intro", "content": "Jeff is 18 and he lives in Dou'
+        malformed = '[{"header": "Intro" "content": "Jeff is 18."}, {"header": "End", "content": "Bye"}]'
+        valid = '[{"header": "Intro", "content": "Jeff is 18."}]'
+
+        llm_service = ScriptedLLMService([empty, truncated, malformed, valid])
+        algorithm = MJRagAlgorithm("test", DummyVectorDBService(), llm_service, content_cache_path=None)
+        _, sections = algorithm.split_content_with_llm("Jeff is 18.")
+        self.assertEqual(sections[0]['content'], "# Intro\n\nJeff is 18.")
+
+        errors_sent = [["truncated" if error.startswith("Your response was truncated") else "invalid"
+                        for error in errors] for errors in llm_service.errors_sent]
+        # only the last two errors are sent back
+        self.assertEqual(errors_sent, [[], ["invalid"], ["invalid", "truncated"], ["truncated", "invalid"]])
+
+        llm_service = ScriptedLLMService([malformed] * 5)
+        algorithm = MJRagAlgorithm("test", DummyVectorDBService(), llm_service, content_cache_path=None)
+        with self.assertRaisesRegex(ValueError, "after 5 tries"):
+            algorithm.split_content_with_llm("Jeff is 18.")
+
+        llm_service = ScriptedLLMService([malformed] * 5)
+        algorithm = MJRagAlgorithm("test", DummyVectorDBService(), llm_service, content_cache_path=None)
+        with self.assertRaisesRegex(ValueError, "after 1 tries"):
+            algorithm.split_content_with_llm("Jeff is 18.", retry_timeout=0)
+
+    def test_35_max_concurrent_llm_calls_validated(self):
+        with self.assertRaisesRegex(ValueError, "max_concurrent_llm_calls"):
+            MJRagAlgorithm("test", DummyVectorDBService(), DummyLLMService(),
+                           max_concurrent_llm_calls=0, content_cache_path=None)
+
+    def test_36_enrich_sections(self):
+        algorithm = MJRagAlgorithm("test", DummyVectorDBService(), DummyLLMService(), content_cache_path=None)
+        sections = [{'header': "Intro", 'content': "Hello",
+                     'subsections': [{'header': "Details", 'content': "World",
+                                      'subsections': [{'header': "Deep", 'content': "Down"}]},
+                                     {'header': "More", 'content': "Again"}]},
+                    {'header': "End", 'content': "Bye"}]
+        # the result of the former recursive implementation
+        self.assertEqual(algorithm.enrich_sections(sections), [
+            {'header': "Intro",
+             'content': "# Intro\n\nHello\n\n## Details\n\nWorld\n\n### Deep\n\nDown\n\n## More\n\nAgain",
+             'subsections': [{'header': "Details",
+                              'content': "## Details\n\nWorld\n\n### Deep\n\nDown",
+                              'subsections': [{'header': "Deep", 'content': "### Deep\n\nDown",
+                                               'parents': ["Intro", "Details"], 'level': 3}],
+                              'parents': ["Intro"], 'level': 2},
+                             {'header': "More", 'content': "## More\n\nAgain", 'parents': ["Intro"], 'level': 2}],
+             'parents': [], 'level': 1},
+            {'header': "End", 'content': "# End\n\nBye", 'parents': [], 'level': 1},
+        ])
@@ -19,3 +19,23 @@ class TestPdfReader(TestCase):
     def test_03_clean_markdown(self):
         reader = MjPdfReader(file_path="texts/simple_pdf.pdf")
         md_text = reader.get_markdown()
+
+    def test_04_get_markdown(self):
+        reader = MjPdfReader(file_path="texts/simple_pdf.pdf")
+
+        # every line holding a recurrent text removed one text at a time, as the reader first did
+        expected = pymupdf4llm.to_markdown(reader.doc)
+        for value in reader.get_list_of_recurrent_texts_as_dict().values():
+            for repeated in value['texts']:
+                repeated_for_rgx = re.sub(r"(?:\\ )+", " +", re.escape(repeated))
+                expected = re.sub(f"[^\n]*{repeated_for_rgx}[^\n]*", "", expected)
+        expected = re.sub(r"\n{4,}", "\n\n", expected)
+
+        self.assertEqual(reader.get_markdown(), expected)
+
+        # the memoized passes are not exposed to the caller's edits
+        for value in reader.get_list_of_recurrent_texts_as_dict().values():
+            value['texts'].clear()
+        self.assertEqual(reader.get_list_of_recurrent_texts_as_dict(),
+                         MjPdfReader(file_path="texts/simple_pdf.pdf").get_list_of_recurrent_texts_as_dict())
+        self.assertEqual(reader.get_markdown(), expected)